@@ -8,14 +8,25 @@ This script:
 3. Extracts request/response patterns
 4. Generates a report of findings
 
+Findings are streamed to data/analyzed/ as endpoints are found, so
+output memory doesn't grow with the number of endpoints. Response bodies
+above --body-threshold bytes are written once to data/analyzed/bodies/
+(named by SHA-256) and referenced from the findings.
+
 Usage:
     python analyze_traffic.py <capture_file.har>
     python analyze_traffic.py <capture_file.json>
+    python analyze_traffic.py <capture_file.har> --body-threshold 65536
 """
 
 import argparse
+import hashlib
 import json
+import os
+import re
 import sys
+import tempfile
+from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
 from urllib.parse import urlparse
@@ -25,16 +36,170 @@ from rich.syntax import Syntax
 from rich import box
 from rich.panel import Panel
 
+from fetch_planner import classify_asset
+from token_cache import jwt_expiry
+
 console = Console()
 
+# Path segments that identify a resource rather than an endpoint
+# (numeric IDs, store IDs like T-1234, UUIDs, long hex hashes)
+ID_SEGMENT = re.compile(
+    r"^(?:\d+|T-\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,})$",
+    re.IGNORECASE
+)
+
+# Headers that describe a single request/connection and must not be replayed
+PER_REQUEST_HEADERS = {
+    "host",
+    "content-length",
+    "connection",
+    "transfer-encoding",
+    "keep-alive",
+    "if-none-match",
+    "if-modified-since"
+}
+
+# Path fragments of endpoints that issue auth tokens
+AUTH_PATTERNS = ["oauth", "token", "auth", "login", "session"]
+
+
+def endpoint_template(path):
+    """Collapse ID-like path segments into `{id}` placeholders."""
+    return "/".join("{id}" if ID_SEGMENT.match(s) else s for s in path.split("/"))
+
+
+def template_key(method, domain, path):
+    """Key identifying an endpoint template, e.g. 'GET api.target.com/stores/{id}/map'."""
+    return f"{method.upper()} {domain}{endpoint_template(path)}"
+
+
+def header_dict(headers):
+    """Normalize HAR header lists ([{name, value}]) or plain dicts to a dict."""
+    if isinstance(headers, dict):
+        items = headers.items()
+    else:
+        items = ((h.get("name", ""), h.get("value", "")) for h in headers or [])
+
+    return {
+        name: value for name, value in items
+        if name and not name.startswith(":") and name.lower() not in PER_REQUEST_HEADERS
+    }
+
+
+def response_text(response_content, base_dir="."):
+    """
+    Return a response body as text, reading it from its side file if the
+    analysis moved it out of line.
+    """
+    response_content = response_content or {}
+    if "body_file" in response_content:
+        return (Path(base_dir) / response_content["body_file"]).read_text()
+    return response_content.get("text")
+
+
+class FindingsWriter:
+    """
+    Write analysis findings incrementally as one JSON document.
+
+    Endpoints are encoded and written as they are found, inside an
+    "interesting_endpoints" array, instead of being collected into one
+    dict and dumped at the end. The result loads with a plain json.load.
+
+    Writing goes to a temp file next to output_file that only replaces it
+    on close(), so a failed or empty run leaves a previous analysis intact.
+    """
+
+    def __init__(self, output_file, analyzed_file, body_threshold=None):
+        """
+        Args:
+            output_file: Path of the analysis JSON to write.
+            analyzed_file: Capture file the findings came from.
+            body_threshold: Bodies larger than this many bytes go to
+                bodies/<sha256> next to output_file; None keeps them inline.
+        """
+        self.output_file = Path(output_file)
+        self.bodies_dir = self.output_file.parent / "bodies"
+        self.body_threshold = body_threshold
+        self.count = 0
+        self.closed = False
+
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(
+            'w', dir=self.output_file.parent, prefix=f".{self.output_file.name}.", suffix=".partial", delete=False
+        )
+        self._file.write('{\n  "analyzed_file": %s,\n  "interesting_endpoints": [' % json.dumps(str(analyzed_file)))
+
+    def _externalize(self, response_content):
+        """Move a large body to a content-addressed side file."""
+        text = response_content.get("text")
+        if self.body_threshold is None or not text:
+            return response_content
+
+        body = text.encode("utf-8")
+        if len(body) <= self.body_threshold:
+            return response_content
+
+        sha256 = hashlib.sha256(body).hexdigest()
+        body_file = self.bodies_dir / sha256
+        if not body_file.exists():
+            self.bodies_dir.mkdir(parents=True, exist_ok=True)
+            body_file.write_bytes(body)
+
+        externalized = {key: value for key, value in response_content.items() if key != "text"}
+        externalized.update({"sha256": sha256, "size": len(body), "body_file": f"bodies/{sha256}"})
+        return externalized
+
+    def write_endpoint(self, endpoint):
+        endpoint = dict(endpoint, response_content=self._externalize(endpoint.get("response_content") or {}))
+        self._file.write(("\n    " if self.count == 0 else ",\n    ") + json.dumps(endpoint))
+        self.count += 1
+
+    def close(self, **fields):
+        """Finish the array and write the remaining top-level fields."""
+        if self.closed:
+            return
+        self.closed = True
+        self._file.write("\n  ]")
+        for key, value in fields.items():
+            self._file.write(",\n  %s: %s" % (json.dumps(key), json.dumps(value)))
+        self._file.write("\n}\n")
+        self._file.close()
+        os.replace(self._file.name, self.output_file)
+
+    def discard(self):
+        """Close and delete the partial output, e.g. when nothing was found."""
+        if self.closed:
+            return
+        self.closed = True
+        self._file.close()
+        os.unlink(self._file.name)
+
+
+def _parse_timestamp(value):
+    """Parse a HAR startedDateTime into a Unix timestamp, or None."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
 
 class TrafficAnalyzer:
     """Analyze captured traffic for store map endpoints."""
     
-    def __init__(self, capture_file):
+    def __init__(self, capture_file, body_threshold=None):
         self.capture_file = Path(capture_file)
+        self.body_threshold = body_threshold
         self.requests = []
-        self.interesting_endpoints = []
+        # Findings stream to disk; only a count and a preview stay in memory
+        self.interesting_count = 0
+        self.preview_endpoints = []  # First 20, without response bodies
+        self.example_endpoint = None
+        self.output_file = Path("data/analyzed") / f"analysis_{self.capture_file.stem}.json"
+        self._writer = None
+        self.endpoint_headers = {}  # template key -> {"headers", "auth"}
+        self.auth_endpoint = None
         
         # Patterns that might indicate store map data
         self.map_patterns = [
@@ -92,6 +257,8 @@ class TrafficAnalyzer:
                 "method": request["method"],
                 "url": request["url"],
                 "headers": request.get("headers", []),
+                "post_data": request.get("postData", {}).get("text"),
+                "started": entry.get("startedDateTime"),
                 "status": response.get("status", 0),
                 "response_size": response.get("bodySize", 0),
                 "response_content": response.get("content", {})
@@ -123,11 +290,16 @@ class TrafficAnalyzer:
         console.print()
         
         # Analyze each Target domain
-        for domain in target_domains:
-            self._analyze_domain(domain, by_domain[domain])
-        
-        # Generate summary
-        self._generate_summary()
+        self._writer = FindingsWriter(self.output_file, self.capture_file, self.body_threshold)
+        try:
+            for domain in target_domains:
+                self._analyze_domain(domain, by_domain[domain])
+            
+            # Generate summary
+            self._generate_summary()
+        except BaseException:
+            self._writer.discard()
+            raise
     
     def _analyze_domain(self, domain, requests):
         """Analyze requests for a specific domain."""
@@ -137,12 +309,17 @@ class TrafficAnalyzer:
             parsed = urlparse(req["url"])
             path = parsed.path
             
+            self._extract_headers(domain, req, path)
+            
             # Check if path contains interesting patterns
             is_interesting = any(pattern in path.lower() for pattern in self.map_patterns)
             is_interesting = is_interesting or any(pattern in parsed.query.lower() for pattern in self.map_patterns)
+            # Icons, sprites, fonts and styles rarely mention the map in their
+            # path, but the map is drawn with them; keep them for FetchPlanner
+            is_interesting = is_interesting or (req["method"].upper() == "GET" and classify_asset(path) == "shared")
             
             if is_interesting:
-                self.interesting_endpoints.append({
+                self._record_endpoint({
                     "domain": domain,
                     "method": req["method"],
                     "url": req["url"],
@@ -153,9 +330,67 @@ class TrafficAnalyzer:
                     "response_content": req.get("response_content", {})
                 })
     
+    def _record_endpoint(self, endpoint):
+        """Stream an endpoint to the findings file, keeping only a preview."""
+        self._writer.write_endpoint(endpoint)
+        self.interesting_count += 1
+        
+        if self.example_endpoint is None:
+            self.example_endpoint = endpoint
+        if len(self.preview_endpoints) < 20:
+            self.preview_endpoints.append({k: v for k, v in endpoint.items() if k != "response_content"})
+    
+    def _extract_headers(self, domain, req, path):
+        """Record the replayable header set and auth token for an endpoint template."""
+        headers = header_dict(req.get("headers", []))
+        key = template_key(req["method"], domain, path)
+        
+        auth = None
+        for name, value in headers.items():
+            if name.lower() == "authorization" and " " in value:
+                scheme, token = value.split(" ", 1)
+                auth = {"header": name, "scheme": scheme, "token": token, "expires_at": jwt_expiry(token)}
+            elif name.lower() in ("x-api-key", "api-key"):
+                auth = auth or {"header": name, "scheme": None, "token": value, "expires_at": None}
+        
+        # Later requests carry fresher tokens, but never replace a known
+        # token with an unauthenticated header set
+        previous = self.endpoint_headers.get(key)
+        if previous is None or auth is not None or previous["auth"] is None:
+            self.endpoint_headers[key] = {"headers": headers, "auth": auth}
+        
+        if any(pattern in path.lower() for pattern in AUTH_PATTERNS):
+            self._extract_auth_endpoint(domain, req, headers)
+    
+    def _extract_auth_endpoint(self, domain, req, headers):
+        """Remember the request that issued a token so the downloader can replay it."""
+        text = req.get("response_content", {}).get("text")
+        try:
+            body = json.loads(text) if text else {}
+        except (json.JSONDecodeError, TypeError):
+            return
+        
+        if not isinstance(body, dict) or "access_token" not in body:
+            return
+        
+        issued_at = _parse_timestamp(req.get("started"))
+        expires_in = body.get("expires_in")
+        self.auth_endpoint = {
+            "domain": domain,
+            "method": req["method"],
+            "url": req["url"],
+            "headers": headers,
+            "body": req.get("post_data"),
+            "token_field": "access_token",
+            "token": body["access_token"],
+            "expires_in": expires_in,
+            "issued_at": issued_at
+        }
+    
     def _generate_summary(self):
         """Generate analysis summary."""
-        if not self.interesting_endpoints:
+        if not self.interesting_count:
+            self._writer.discard()
             console.print("[yellow]⚠ No store map-related endpoints found[/yellow]\n")
             console.print("This could mean:")
             console.print("  • Store Mode was not triggered in the app")
@@ -163,7 +398,7 @@ class TrafficAnalyzer:
             console.print("  • Need to capture more interactions\n")
             return
         
-        console.print(f"\n[green]✓ Found {len(self.interesting_endpoints)} interesting endpoints[/green]\n")
+        console.print(f"\n[green]✓ Found {self.interesting_count} interesting endpoints[/green]\n")
         
         # Create table of findings
         table = Table(title="Potential Store Map Endpoints", box=box.ROUNDED)
@@ -172,7 +407,7 @@ class TrafficAnalyzer:
         table.add_column("Status", style="green")
         table.add_column("Size", style="yellow")
         
-        for endpoint in self.interesting_endpoints[:20]:  # Show first 20
+        for endpoint in self.preview_endpoints:  # Show first 20
             table.add_row(
                 endpoint["method"],
                 endpoint["path"][:60] + "..." if len(endpoint["path"]) > 60 else endpoint["path"],
@@ -187,30 +422,22 @@ class TrafficAnalyzer:
         self._save_findings()
         
         # Show example endpoint
-        if self.interesting_endpoints:
+        if self.example_endpoint:
             self._show_example_endpoint()
     
     def _save_findings(self):
-        """Save analysis findings to file."""
-        output_dir = Path("data/analyzed")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        output_file = output_dir / f"analysis_{self.capture_file.stem}.json"
-        
-        findings = {
-            "analyzed_file": str(self.capture_file),
-            "total_requests": len(self.requests),
-            "interesting_endpoints": self.interesting_endpoints
-        }
-        
-        with open(output_file, 'w') as f:
-            json.dump(findings, f, indent=2)
+        """Finish the streamed findings file."""
+        self._writer.close(
+            total_requests=len(self.requests),
+            endpoint_headers=self.endpoint_headers,
+            auth_endpoint=self.auth_endpoint
+        )
         
-        console.print(f"[green]✓ Detailed findings saved to: {output_file}[/green]\n")
+        console.print(f"[green]✓ Detailed findings saved to: {self.output_file}[/green]\n")
     
     def _show_example_endpoint(self):
         """Show details of an example endpoint."""
-        endpoint = self.interesting_endpoints[0]
+        endpoint = self.example_endpoint
         
         console.print("[cyan]📋 Example Endpoint Detail:[/cyan]\n")
         
@@ -242,12 +469,17 @@ def main():
     """Main analysis function."""
     parser = argparse.ArgumentParser(description="Analyze Target app API traffic")
     parser.add_argument("capture_file", help="Captured traffic file (HAR or JSON)")
+    parser.add_argument(
+        "--body-threshold",
+        type=int,
+        help="Move response bodies larger than this many bytes to data/analyzed/bodies/"
+    )
     
     args = parser.parse_args()
     
     console.print("\n[bold cyan]Target API Traffic Analyzer[/bold cyan]\n")
     
-    analyzer = TrafficAnalyzer(args.capture_file)
+    analyzer = TrafficAnalyzer(args.capture_file, body_threshold=args.body_threshold)
     
     if not analyzer.load_capture():
         return 1
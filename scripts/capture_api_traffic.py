@@ -83,13 +83,13 @@ def generate_table(captured_count, interesting_count):
     return table
 
 
-def check_mitmproxy_running():
+def check_mitmproxy_running(port=8080):
     """Check if mitmproxy is running."""
     import socket
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(2)
-        result = sock.connect_ex(("localhost", 8080))
+        result = sock.connect_ex(("localhost", port))
         sock.close()
         return result == 0
     except:
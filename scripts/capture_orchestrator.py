@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Capture Store Mode traffic for many stores across several emulators.
+
+Each emulator is paired with its own mitmdump instance on a separate
+port. The store list is sharded across the pairs, and every pair works
+through its shard independently:
+
+1. Start mitmdump on the pair's port, writing a HAR for this store
+2. Point the device's proxy at that port
+3. Spoof the device's GPS to the store's coordinates
+4. Launch the Target app (and an optional UI trigger script)
+5. Wait for the dwell time, then stop mitmdump so the HAR is flushed
+
+Capture throughput therefore scales with the number of emulators. The adb
+and mitmdump executables are configurable, so stub scripts can stand in
+for both.
+
+Usage:
+    python capture_orchestrator.py
+    python capture_orchestrator.py --devices emulator-5554,emulator-5556 --dwell 90
+    python capture_orchestrator.py --trigger-script scripts/open_store_mode.sh
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+from capture_api_traffic import check_mitmproxy_running
+from verify_setup import list_devices
+
+console = Console()
+
+TARGET_PACKAGE = "com.target.ui"
+
+
+def load_stores(stores_file):
+    """Load store dicts (id, name, coordinates) from target_stores.json."""
+    with open(stores_file, 'r') as f:
+        return json.load(f).get("stores", [])
+
+
+def shard(stores, count):
+    """Split stores round-robin into `count` shards."""
+    return [stores[i::count] for i in range(count)]
+
+
+class CaptureWorker:
+    """One emulator paired with one mitmdump port."""
+
+    def __init__(
+        self,
+        serial,
+        port,
+        output_dir=Path("data/captured"),
+        adb="adb",
+        mitmdump="mitmdump",
+        proxy_host="10.0.2.2",
+        dwell=60,
+        trigger_script=None,
+        startup_timeout=15
+    ):
+        self.serial = serial
+        self.port = port
+        self.output_dir = Path(output_dir)
+        self.adb_path = adb
+        self.mitmdump_path = mitmdump
+        self.proxy_host = proxy_host
+        self.dwell = dwell
+        self.trigger_script = trigger_script
+        self.startup_timeout = startup_timeout
+
+    def adb(self, *args, timeout=30):
+        """Run an adb command against this worker's device."""
+        return subprocess.run(
+            [self.adb_path, "-s", self.serial] + [str(arg) for arg in args],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            check=True
+        )
+
+    def start_proxy(self, har_file):
+        """Start mitmdump writing a HAR and wait until it accepts connections."""
+        # Another proxy (e.g. the manual mitmweb flow on 8080) would answer
+        # our readiness check while our mitmdump fails to bind
+        if check_mitmproxy_running(self.port):
+            raise RuntimeError(f"Port {self.port} is already in use; pick another --base-port")
+
+        # mitmdump's output goes to a log file: a pipe nobody reads during
+        # the dwell would fill up and block it
+        log_file = self.output_dir / f"mitmdump_{self.port}.log"
+        with open(log_file, 'ab') as log:
+            process = subprocess.Popen(
+                [
+                    self.mitmdump_path,
+                    "--listen-port", str(self.port),
+                    "--set", f"hardump={har_file}",
+                    "-q"
+                ],
+                stdout=log,
+                stderr=subprocess.STDOUT
+            )
+
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"mitmdump exited on port {self.port}, see {log_file}")
+            if check_mitmproxy_running(self.port):
+                return process
+            time.sleep(0.2)
+
+        self.stop_proxy(process)
+        raise RuntimeError(f"mitmdump did not start listening on port {self.port}, see {log_file}")
+
+    def stop_proxy(self, process, timeout=15):
+        """Stop mitmdump with SIGINT so it writes the HAR before exiting."""
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def capture_store(self, store):
+        """Capture one store's traffic; returns the HAR path."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        har_file = self.output_dir / f"store_{store['id']}_{timestamp}.har"
+        coordinates = store["coordinates"]
+
+        process = self.start_proxy(har_file)
+        try:
+            self.adb("shell", "settings", "put", "global", "http_proxy", f"{self.proxy_host}:{self.port}")
+            # `geo fix` takes longitude first
+            self.adb("emu", "geo", "fix", coordinates["longitude"], coordinates["latitude"])
+            self.adb("shell", "am", "force-stop", TARGET_PACKAGE)
+            self.adb("shell", "monkey", "-p", TARGET_PACKAGE, "-c", "android.intent.category.LAUNCHER", "1")
+
+            if self.trigger_script:
+                env = dict(os.environ, SERIAL=self.serial, STORE_ID=store["id"], PROXY_PORT=str(self.port))
+                subprocess.run([self.trigger_script], env=env, check=True, timeout=self.dwell + 60)
+
+            time.sleep(self.dwell)
+        finally:
+            self.stop_proxy(process)
+
+        if not har_file.exists() or har_file.stat().st_size == 0:
+            raise RuntimeError(f"mitmdump wrote no HAR to {har_file}")
+        return har_file
+
+    def run(self, stores, on_result):
+        """Capture every store in this worker's shard, reporting each result."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            for store in stores:
+                try:
+                    on_result(store["id"], self.serial, str(self.capture_store(store)), None)
+                except Exception as e:
+                    on_result(store["id"], self.serial, None, str(e))
+        finally:
+            try:
+                self.adb("shell", "settings", "put", "global", "http_proxy", ":0")
+            except (subprocess.SubprocessError, OSError):
+                pass
+
+
+class CaptureOrchestrator:
+    """Run one CaptureWorker per device over shards of the store list."""
+
+    def __init__(self, devices, base_port=8080, **worker_options):
+        self.workers = [
+            CaptureWorker(serial, base_port + i, **worker_options)
+            for i, serial in enumerate(devices)
+        ]
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def _record(self, store_id, serial, har_file, error):
+        with self._lock:
+            self.results[store_id] = {"device": serial, "capture_file": har_file, "error": error}
+        if error:
+            console.print(f"[red]✗ {store_id} on {serial}: {error}[/red]")
+        else:
+            console.print(f"[green]✓ {store_id} on {serial}: {har_file}[/green]")
+
+    def run(self, stores):
+        """Capture all stores; returns {store_id: result}."""
+        shards = shard(stores, len(self.workers))
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as executor:
+            futures = [
+                executor.submit(worker.run, stores_shard, self._record)
+                for worker, stores_shard in zip(self.workers, shards)
+            ]
+            for future in futures:
+                future.result()
+        return self.results
+
+    def save_manifest(self, output_dir):
+        """Write the store -> capture file mapping for analyze_traffic.py."""
+        manifest_file = Path(output_dir) / f"orchestrator_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(manifest_file, 'w') as f:
+            json.dump({
+                "devices": [{"serial": w.serial, "port": w.port} for w in self.workers],
+                "results": self.results
+            }, f, indent=2)
+        return manifest_file
+
+
+def main():
+    """Main orchestration function."""
+    parser = argparse.ArgumentParser(description="Capture Store Mode traffic on many emulators")
+    parser.add_argument("--stores-file", default="config/target_stores.json", help="Stores to capture")
+    parser.add_argument("--devices", help="Comma-separated device serials (default: all attached)")
+    parser.add_argument("--base-port", type=int, default=8080, help="First proxy port; device N uses base + N")
+    parser.add_argument("--proxy-host", default="10.0.2.2", help="Host address as seen from the devices")
+    parser.add_argument("--dwell", type=float, default=60, help="Seconds to capture per store")
+    parser.add_argument("--trigger-script", help="Script run per store to drive the app (gets SERIAL, STORE_ID)")
+    parser.add_argument("--output-dir", default="data/captured", help="Directory for per-store HAR files")
+    parser.add_argument("--adb", default="adb", help="adb executable")
+    parser.add_argument("--mitmdump", default="mitmdump", help="mitmdump executable")
+
+    args = parser.parse_args()
+
+    console.print("\n[bold cyan]Target Store Mode Capture Orchestrator[/bold cyan]\n")
+
+    devices = args.devices.split(",") if args.devices else list_devices()
+    if not devices:
+        console.print("[red]✗ No devices attached[/red]")
+        console.print("Start emulators first, then check with: python scripts/verify_setup.py\n")
+        return 1
+
+    stores = load_stores(args.stores_file)
+    orchestrator = CaptureOrchestrator(
+        devices,
+        base_port=args.base_port,
+        output_dir=Path(args.output_dir),
+        adb=args.adb,
+        mitmdump=args.mitmdump,
+        proxy_host=args.proxy_host,
+        dwell=args.dwell,
+        trigger_script=args.trigger_script
+    )
+
+    table = Table(title="Capture Plan", box=box.ROUNDED)
+    table.add_column("Device", style="cyan")
+    table.add_column("Proxy Port", style="magenta")
+    table.add_column("Stores", style="green")
+    for worker, stores_shard in zip(orchestrator.workers, shard(stores, len(devices))):
+        table.add_row(worker.serial, str(worker.port), ", ".join(s["id"] for s in stores_shard))
+    console.print(table)
+    console.print()
+
+    results = orchestrator.run(stores)
+    manifest = orchestrator.save_manifest(args.output_dir)
+    failed = [store_id for store_id, result in results.items() if result["error"]]
+
+    console.print(f"\n[green]✓ Captured {len(results) - len(failed)}/{len(results)} stores[/green]")
+    console.print(f"Manifest: {manifest}\n")
+    console.print("[yellow]Analyze each capture with:[/yellow]")
+    console.print("  python scripts/analyze_traffic.py data/captured/store_<id>_<timestamp>.har\n")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,29 +10,133 @@ This script will:
 Usage:
     python download_store_map.py --store-id T-1234
     python download_store_map.py --coordinates 44.9778,-93.2650
+    python download_store_map.py --all-stores --workers 8
 """
 
 import argparse
 import json
+import shutil
+import sqlite3
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse
 import requests
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
+from analyze_traffic import template_key
+from fetch_planner import AssetFetcher, FetchPlanner, SharedAssetCache
+from map_query import update_map_index
+from rate_limiter import THROTTLE_STATUSES, AdaptiveRateLimiter, parse_retry_after
+from token_cache import TokenCache, TokenRefreshError
+
 console = Console()
 
+# Used when the analysis has no captured headers for an endpoint
+DEFAULT_HEADERS = {
+    "User-Agent": "Target/Android",
+    "Accept": "application/json",
+    "Content-Type": "application/json"
+}
+
+
+def make_token_refresher(auth_endpoint, timeout=30, rewrite_url=None):
+    """
+    Build a TokenCache refresher that replays the captured auth request.
+
+    The returned callable ignores its scope argument: the capture holds a
+    single auth endpoint, whose token is used for every Target domain.
+    rewrite_url, if given, maps the captured URL to the one to call
+    (e.g. StoreMapDownloader._target_url for a replay server).
+    """
+    def refresh(scope):
+        url = rewrite_url(auth_endpoint["url"]) if rewrite_url else auth_endpoint["url"]
+        response = requests.request(
+            auth_endpoint["method"],
+            url,
+            headers=auth_endpoint.get("headers", {}),
+            data=auth_endpoint.get("body"),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        body = response.json()
+        
+        token = body[auth_endpoint.get("token_field", "access_token")]
+        expires_in = body.get("expires_in")
+        expires_at = time.time() + float(expires_in) if expires_in else None
+        return token, expires_at
+    
+    return refresh
+
+
+def _release_on_close(response, release):
+    """Call release() once, when a streamed response is closed."""
+    close = response.close
+    released = []
+    
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                release()
+    
+    response.close = close_and_release
+
 
 class StoreMapDownloader:
     """Download and save Target store maps."""
     
-    def __init__(self, store_id=None, coordinates=None):
+    def __init__(
+        self,
+        store_id=None,
+        coordinates=None,
+        token_cache=None,
+        rate_limiter=None,
+        asset_cache=None
+    ):
         self.store_id = store_id
         self.coordinates = coordinates
         self.api_base = None  # To be discovered from analysis
         self.headers = {}  # To be extracted from captured session
-        self.session = requests.Session()
+        self.endpoint_headers = {}  # Captured header sets per endpoint template
+        self.auth_endpoint = None
+        self.example_endpoint = None
+        self.token_cache = token_cache or TokenCache()
+        self.rate_limiter = rate_limiter
+        self.asset_cache = asset_cache or SharedAssetCache()
+        self.planner = None  # Built from analysis endpoints
+        self.base_url = None  # Overrides the captured scheme/host, e.g. a replay server
+        self._local = threading.local()
+    
+    @property
+    def session(self):
+        """Per-thread requests session; assets of one store are fetched in parallel."""
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+    
+    def clone_for_store(self, store_id):
+        """Create a downloader for another store sharing this one's config, tokens and limiter."""
+        clone = StoreMapDownloader(
+            store_id=store_id,
+            token_cache=self.token_cache,
+            rate_limiter=self.rate_limiter,
+            asset_cache=self.asset_cache
+        )
+        clone.api_base = self.api_base
+        clone.headers = dict(self.headers)
+        clone.endpoint_headers = self.endpoint_headers
+        clone.auth_endpoint = self.auth_endpoint
+        clone.example_endpoint = self.example_endpoint
+        clone.planner = self.planner
+        clone.base_url = self.base_url
+        return clone
     
     def load_api_config(self):
         """Load API configuration from analysis results."""
@@ -70,6 +174,11 @@ class StoreMapDownloader:
             if any(keyword in ep["path"].lower() for keyword in ["map", "layout", "store"])
         ]
         
+        self.endpoint_headers = analysis.get("endpoint_headers", {})
+        self.auth_endpoint = analysis.get("auth_endpoint")
+        self._seed_token_cache()
+        self.planner = FetchPlanner(endpoints)
+        
         if map_endpoints:
             self.api_base = map_endpoints[0]["domain"]
             console.print(f"[green]✓ Found API base: {self.api_base}[/green]")
@@ -80,18 +189,151 @@ class StoreMapDownloader:
         
         return False
     
+    def _issued_expiry(self, token):
+        """Expiry of a token the captured auth endpoint issued, from issued_at + expires_in."""
+        endpoint = self.auth_endpoint or {}
+        if token != endpoint.get("token") or not endpoint.get("issued_at") or not endpoint.get("expires_in"):
+            return None
+        return endpoint["issued_at"] + float(endpoint["expires_in"])
+    
+    def _seed_token_cache(self):
+        """Load captured tokens into the shared cache and configure refresh."""
+        for key, captured in self.endpoint_headers.items():
+            auth = captured.get("auth")
+            if not auth:
+                continue
+            domain = key.split(" ", 1)[1].split("/", 1)[0]
+            # Opaque tokens have no exp claim; fall back to the lifetime
+            # the auth response reported when it issued them
+            expires_at = auth["expires_at"] or self._issued_expiry(auth["token"])
+            current = self.token_cache.peek(domain)
+            # Keep whichever captured token lives longest (None = no expiry)
+            new_expiry = expires_at or float("inf")
+            if current is None or (current[1] or float("inf")) < new_expiry:
+                self.token_cache.put(domain, auth["token"], expires_at)
+        
+        if self.auth_endpoint and self.token_cache.refresher is None:
+            self.token_cache.refresher = make_token_refresher(self.auth_endpoint, rewrite_url=self._target_url)
+    
+    def _captured_headers(self, method, url):
+        """Return the captured header set for the endpoint template of url, if any."""
+        parsed = urlparse(url)
+        return self.endpoint_headers.get(template_key(method, parsed.netloc, parsed.path))
+    
     def set_headers(self):
         """Set request headers based on captured session."""
-        # These will need to be extracted from actual captured traffic
-        # Placeholder headers
-        self.headers = {
-            "User-Agent": "Target/Android",
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            # Add authentication headers here once discovered
-            # "Authorization": "Bearer ...",
-            # "X-API-Key": "..."
-        }
+        captured = None
+        if self.example_endpoint:
+            captured = self._captured_headers(self.example_endpoint["method"], self.example_endpoint["url"])
+        
+        if captured:
+            # Auth headers come from the token cache at request time
+            auth = captured.get("auth")
+            auth_header = auth["header"].lower() if auth else None
+            self.headers = {
+                name: value for name, value in captured["headers"].items()
+                if name.lower() != auth_header
+            }
+        else:
+            self.headers = dict(DEFAULT_HEADERS)
+    
+    def headers_for(self, method, url):
+        """
+        Build headers for a request, including a valid auth token.
+        
+        Returns (headers, token) so callers can invalidate the exact token
+        the server rejected.
+        """
+        captured = self._captured_headers(method, url)
+        auth = captured.get("auth") if captured else None
+        headers = dict(self.headers)
+        if captured:
+            headers.update({
+                name: value for name, value in captured["headers"].items()
+                if not auth or name.lower() != auth["header"].lower()
+            })
+        
+        domain = urlparse(url).netloc
+        token = self.token_cache.get(domain)
+        if token:
+            name = auth["header"] if auth else "Authorization"
+            scheme = auth["scheme"] if auth else "Bearer"
+            headers[name] = f"{scheme} {token}" if scheme else token
+        
+        return headers, token
+    
+    def request(self, method, url, max_retries=3, **kwargs):
+        """
+        Send an authenticated request.
+        
+        Refreshes the token once on a 401 (when a refresher is configured)
+        and retries 429/503 responses up to max_retries times; the rate
+        limiter handles the backoff.
+        """
+        domain = urlparse(url).netloc
+        extra_headers = kwargs.pop("headers", {})
+        kwargs.setdefault("timeout", 30)
+        refreshed = False
+        throttled = 0
+        
+        while True:
+            headers, token = self.headers_for(method, url)
+            headers.update(extra_headers)
+            response = self._send(method, self._target_url(url), headers=headers, **kwargs)
+            
+            # Without a refresher a rejected token can't be replaced, so the
+            # 401 is returned to the caller as is
+            if response.status_code == 401 and token and not refreshed and self.token_cache.refresher:
+                self.token_cache.invalidate(domain, token)
+                refreshed = True
+            elif response.status_code in THROTTLE_STATUSES and throttled < max_retries:
+                throttled += 1
+                if self.rate_limiter is None:
+                    time.sleep(parse_retry_after(response.headers.get("Retry-After")) or 2 ** throttled)
+            else:
+                return response
+            
+            # Release the connection of a streamed response we're retrying
+            response.close()
+    
+    def _target_url(self, url):
+        """Swap the captured scheme/host for base_url, keeping path and query."""
+        if not self.base_url:
+            return url
+        base = urlparse(self.base_url)
+        return urlparse(url)._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+    
+    def _send(self, method, url, **kwargs):
+        """Send one request through the shared rate limiter, if any."""
+        if self.rate_limiter is None:
+            return self.session.request(method, url, **kwargs)
+        
+        self.rate_limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            self.rate_limiter.release(None, time.monotonic() - start)
+            raise
+        
+        # Latency is time to first byte: body transfer time grows with asset
+        # size, so counting it would make large tiles look like congestion
+        latency = time.monotonic() - start
+        
+        def release():
+            self.rate_limiter.release(
+                response.status_code,
+                latency,
+                response.headers.get("Retry-After")
+            )
+        
+        if kwargs.get("stream"):
+            # The body is still to be read: keep the slot until the caller
+            # closes the response
+            _release_on_close(response, release)
+        else:
+            release()
+        return response
     
     def find_store_by_coordinates(self):
         """Find store ID by coordinates (if only coordinates provided)."""
@@ -108,30 +350,23 @@ class StoreMapDownloader:
         console.print("Please provide a store ID with --store-id\n")
         return False
     
-    def download_map(self):
+    def download_map(self, show_progress=True):
         """Download store map data."""
         console.print(f"\n[cyan]📍 Downloading map for store: {self.store_id}[/cyan]\n")
         
+        # Only one live display can be active, so fleet workers run without one
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
-            console=console
+            console=console,
+            disable=not show_progress
         ) as progress:
             
             task = progress.add_task("Fetching store map data...", total=None)
             
-            # Construct API URL (placeholder - update based on findings)
-            # Example format might be:
-            # url = f"https://{self.api_base}/api/v1/stores/{self.store_id}/map"
-            
-            # For now, return mock data structure
-            progress.update(task, description="Parsing response...")
-            
-            # This is placeholder structure - update based on actual API response
             map_data = {
                 "store_id": self.store_id,
                 "downloaded_at": datetime.now().isoformat(),
-                "note": "This is placeholder data - update after capturing real API response",
                 "map": {
                     "format": "unknown",  # Could be GeoJSON, SVG, vector tiles, etc.
                     "data": None
@@ -143,12 +378,31 @@ class StoreMapDownloader:
                 }
             }
             
+            if self.planner is None or not self.planner.templates:
+                map_data["note"] = "No map asset endpoints in analysis - capture Store Mode traffic first"
+                progress.update(task, description="✓ Complete")
+                return map_data
+            
+            # Layout first, then every tile/geometry/POI asset in parallel
+            progress.update(task, description="Fetching layout and map assets...")
+            fetcher = AssetFetcher(self.request, self.asset_cache)
+            map_data["map"], map_data["metadata"] = fetcher.fetch_store(self.planner, self.store_id)
+            
+            failed = [asset for asset in map_data["map"]["assets"] if "error" in asset]
+            if failed:
+                console.print(f"[yellow]⚠ {self.store_id}: {len(failed)} of {len(map_data['map']['assets'])} assets failed[/yellow]")
+            
             progress.update(task, description="✓ Complete")
         
         return map_data
     
     def save_map(self, map_data):
-        """Save downloaded map to file."""
+        """
+        Save downloaded map to file.
+        
+        Asset bodies were already streamed to data/maps/assets while
+        downloading; the saved map references them by body_file.
+        """
         output_dir = Path("data/maps")
         output_dir.mkdir(parents=True, exist_ok=True)
         
@@ -164,24 +418,80 @@ class StoreMapDownloader:
         latest_link = output_dir / f"store_{self.store_id}_latest.json"
         if latest_link.exists():
             latest_link.unlink()
-        latest_link.write_text(output_file.read_text())
+        shutil.copyfile(output_file, latest_link)
+        
+        # Keep the fleet query index current; a stale index shouldn't fail the download
+        try:
+            update_map_index(self.store_id, latest_link, map_data)
+        except (sqlite3.Error, OSError) as e:
+            console.print(f"[yellow]⚠ Could not update map index: {e}[/yellow]")
         
         return output_file
 
 
+def load_store_ids(stores_file):
+    """Load store IDs from a target_stores.json-style config file."""
+    with open(stores_file, 'r') as f:
+        config = json.load(f)
+    return [store["id"] for store in config.get("stores", [])]
+
+
+def download_stores(base_downloader, store_ids, workers=4):
+    """
+    Download maps for many stores concurrently.
+    
+    Every worker shares the base downloader's API config, token cache and
+    rate limiter, so an expired token is refreshed once for the whole crawl
+    and throttling from the server slows every worker down together.
+    
+    Returns a dict of store ID -> saved file path (or None on failure).
+    """
+    results = {}
+    if base_downloader.rate_limiter is None:
+        base_downloader.rate_limiter = AdaptiveRateLimiter(max_limit=workers * 4)
+    
+    def download_one(store_id):
+        downloader = base_downloader.clone_for_store(store_id)
+        map_data = downloader.download_map(show_progress=False)
+        return downloader.save_map(map_data) if map_data else None
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_one, store_id): store_id for store_id in store_ids}
+        for future in as_completed(futures):
+            store_id = futures[future]
+            try:
+                results[store_id] = future.result()
+            except Exception as e:
+                console.print(f"[red]✗ {store_id}: {e}[/red]")
+                results[store_id] = None
+    
+    metrics = base_downloader.rate_limiter.snapshot()
+    console.print(
+        f"[cyan]Rate limiter: {metrics['requests_per_second']} req/s, "
+        f"concurrency limit {metrics['concurrency_limit']}, "
+        f"{metrics['throttled']} throttled responses[/cyan]"
+    )
+    
+    return results
+
+
 def main():
     """Main download function."""
     parser = argparse.ArgumentParser(description="Download Target store map")
     parser.add_argument("--store-id", help="Target store ID (e.g., T-1234)")
     parser.add_argument("--coordinates", help="Store coordinates (lat,lng)")
     parser.add_argument("--output-dir", help="Output directory for maps")
+    parser.add_argument("--all-stores", action="store_true", help="Download every store in --stores-file")
+    parser.add_argument("--stores-file", default="config/target_stores.json", help="Store list for --all-stores")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent downloads for --all-stores")
+    parser.add_argument("--base-url", help="Send requests here instead of the captured host (e.g. replay_server.py)")
     
     args = parser.parse_args()
     
     console.print("\n[bold cyan]Target Store Map Downloader (v1)[/bold cyan]\n")
     
-    if not args.store_id and not args.coordinates:
-        console.print("[red]✗ Must provide either --store-id or --coordinates[/red]\n")
+    if not args.store_id and not args.coordinates and not args.all_stores:
+        console.print("[red]✗ Must provide either --store-id, --coordinates or --all-stores[/red]\n")
         parser.print_help()
         return 1
     
@@ -190,6 +500,8 @@ def main():
         coordinates=args.coordinates
     )
     
+    downloader.base_url = args.base_url
+    
     # Load API configuration from analysis
     console.print("[cyan]Step 1: Loading API configuration...[/cyan]")
     if not downloader.load_api_config():
@@ -205,13 +517,30 @@ def main():
     downloader.set_headers()
     console.print("[green]✓ Headers configured[/green]")
     
+    if args.all_stores:
+        store_ids = load_store_ids(args.stores_file)
+        console.print(f"\n[cyan]Step 3: Downloading {len(store_ids)} stores with {args.workers} workers...[/cyan]")
+        results = download_stores(downloader, store_ids, workers=args.workers)
+        failed = [store_id for store_id, path in results.items() if path is None]
+        
+        console.print(f"\n[green]✓ Downloaded {len(results) - len(failed)}/{len(results)} store maps[/green]\n")
+        return 1 if failed else 0
+    
     # Find store if needed
     if not downloader.find_store_by_coordinates():
         return 1
     
     # Download map
     console.print("\n[cyan]Step 3: Downloading store map...[/cyan]")
-    map_data = downloader.download_map()
+    try:
+        map_data = downloader.download_map()
+    except requests.RequestException as e:
+        console.print(f"[red]✗ Request failed: {e}[/red]\n")
+        return 1
+    except TokenRefreshError as e:
+        console.print(f"[red]✗ Authentication failed: {e}[/red]")
+        console.print("Capture a fresh session (including the login) and re-run analyze_traffic.py\n")
+        return 1
     
     if not map_data:
         console.print("[red]✗ Failed to download map[/red]\n")
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Plan and fetch the sub-resources that make up a store map.
+
+A Store Mode map is not a single payload: the app loads a layout document
+and then tiles, vector geometry and POI lists per floor, plus icon sets
+and styles shared by every store. This module:
+
+1. Turns captured endpoints into URL templates with {store_id} and
+   {floor} placeholders (FetchPlanner)
+2. Expands one store into its asset requests, fetching the layout first
+   so floor-specific assets can be expanded per floor
+3. Fetches a store's assets concurrently, downloading assets shared
+   between stores only once per crawl (SharedAssetCache)
+4. Assembles everything into one map document for save_map
+
+Asset bodies are streamed to content-addressed files under data/maps/assets
+in fixed-size chunks (decompressed and hashed on the way), so memory per
+download is bounded by the chunk size rather than the payload. Only the
+floors/sections/aisles lists are parsed back out, incrementally with ijson.
+
+Usage:
+    planner = FetchPlanner(analysis["interesting_endpoints"])
+    fetcher = AssetFetcher(downloader.request, SharedAssetCache())
+    map_data = fetcher.fetch_store(planner, "T-1234")
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import warnings
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+
+from token_cache import TokenRefreshError
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Asset kinds, checked in order against the endpoint path
+ASSET_KINDS = [
+    ("shared", ["icon", "sprite", "font", "glyph", "style"]),
+    ("tiles", ["tile"]),
+    ("geometry", ["vector", "geometry", "geojson"]),
+    ("pois", ["poi", "section", "aisle", "department", "zone"]),
+    ("floors", ["floor", "level"]),
+    ("layout", ["map", "layout", "navigation"])
+]
+
+ASSET_DIR = Path("data/maps/assets")
+CHUNK_SIZE = 64 * 1024
+
+METADATA_KEYS = ("floors", "sections", "aisles")
+# extract_metadata only looks this many containers deep
+METADATA_DEPTH = 4
+
+STORE_SEGMENTS = {"store", "stores", "location", "locations"}
+STORE_PARAMS = {"store_id", "storeid", "store", "location_id", "locationid"}
+FLOOR_SEGMENTS = {"floor", "floors", "level", "levels"}
+FLOOR_PARAMS = {"floor", "floor_id", "floorid", "level"}
+
+AssetRequest = namedtuple("AssetRequest", ["kind", "method", "url", "floor", "shared"])
+
+
+def classify_asset(path):
+    """Return the asset kind for an endpoint path, or None if it isn't a map asset."""
+    path = path.lower()
+    for kind, keywords in ASSET_KINDS:
+        if any(keyword in path for keyword in keywords):
+            return kind
+    return None
+
+
+def url_template(url):
+    """
+    Replace the captured store ID and floor in a URL with placeholders.
+
+    The store ID is taken from a store query parameter or the path segment
+    after /stores/; every occurrence of that value is then replaced, so
+    e.g. /stores/1234/floors/1/tiles?store=1234 becomes
+    /stores/{store_id}/floors/{floor}/tiles?store={store_id}.
+
+    Returns (template, captured floor value or None).
+    """
+    parsed = urlparse(url)
+    segments = parsed.path.split("/")
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+
+    store_value = None
+    for name, value in query:
+        if name.lower() in STORE_PARAMS:
+            store_value = value
+    for previous, segment in zip(segments, segments[1:]):
+        if previous.lower() in STORE_SEGMENTS and store_value is None:
+            store_value = segment
+
+    floor_value = None
+    template_segments = []
+    for i, segment in enumerate(segments):
+        if store_value and segment == store_value:
+            segment = "{store_id}"
+        elif i > 0 and segments[i - 1].lower() in FLOOR_SEGMENTS:
+            floor_value, segment = segment, "{floor}"
+        template_segments.append(segment)
+
+    template_query = []
+    for name, value in query:
+        if store_value and value == store_value:
+            value = "{store_id}"
+        elif name.lower() in FLOOR_PARAMS:
+            floor_value, value = value, "{floor}"
+        template_query.append((name, value))
+
+    path = "/".join(template_segments)
+    query_string = urlencode(template_query, safe="{}")
+    return urlunparse(parsed._replace(path=path, query=query_string)), floor_value
+
+
+def extract_metadata(layout):
+    """Find floors/sections/aisles lists in a layout document."""
+    metadata = {key: [] for key in METADATA_KEYS}
+
+    def walk(node, depth):
+        if depth > METADATA_DEPTH:
+            return
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in metadata and isinstance(value, list) and not metadata[key]:
+                    metadata[key] = value
+                else:
+                    walk(value, depth + 1)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, depth + 1)
+
+    walk(layout, 0)
+    return metadata
+
+
+def _stream_metadata(f):
+    """extract_metadata over ijson events, building only the matched lists."""
+    metadata = {key: [] for key in METADATA_KEYS}
+    pending = builder = target = None
+
+    for prefix, event, value in ijson.parse(f):
+        if builder is not None:
+            builder.event(event, value)
+            if event == "end_array" and prefix == target[0]:
+                metadata[target[1]] = builder.value
+                builder = target = None
+            continue
+
+        if pending is not None:
+            if prefix == pending[0] and event == "start_array":
+                builder, target = ijson.ObjectBuilder(), pending
+                builder.event(event, value)
+            pending = None
+
+        if event == "map_key" and value in metadata and not metadata[value]:
+            depth = prefix.count(".") + 1 if prefix else 0
+            if depth <= METADATA_DEPTH:
+                pending = (f"{prefix}.{value}" if prefix else value, value)
+
+    return metadata
+
+
+def extract_metadata_from_file(path):
+    """
+    extract_metadata for a JSON document on disk.
+
+    With ijson installed the file is parsed incrementally and only the
+    floors/sections/aisles lists are materialized; otherwise it is loaded
+    whole.
+    """
+    with open(path, 'rb') as f:
+        if ijson is not None:
+            return _stream_metadata(f)
+        warnings.warn(
+            "ijson is not installed; map assets are loaded whole to extract metadata "
+            "(pip install -r requirements.txt)",
+            RuntimeWarning
+        )
+        return extract_metadata(json.load(f))
+
+
+def floor_ids(floors):
+    """Return the floor identifiers used in asset URLs."""
+    ids = []
+    for floor in floors:
+        if isinstance(floor, dict):
+            value = next((floor[k] for k in ("id", "floor_id", "level", "number") if k in floor), None)
+        else:
+            value = floor
+        if value is not None:
+            ids.append(str(value))
+    return ids
+
+
+class FetchPlanner:
+    """Expand a store ID into the asset requests that make up its map."""
+
+    def __init__(self, endpoints):
+        """
+        Args:
+            endpoints: interesting_endpoints from an analysis file.
+        """
+        self.templates = {}  # url template -> (kind, method, captured floors)
+        for endpoint in endpoints:
+            if endpoint.get("method", "GET").upper() != "GET":
+                continue
+            kind = classify_asset(endpoint["path"])
+            if kind is None:
+                continue
+
+            template, floor = url_template(endpoint["url"])
+            if "{store_id}" not in template:
+                kind = "shared"
+            _, _, floors = self.templates.setdefault(template, (kind, "GET", set()))
+            if floor is not None:
+                floors.add(floor)
+
+    def layout_requests(self, store_id):
+        """Requests for the layout documents fetched before everything else."""
+        return [
+            AssetRequest(kind, method, template.replace("{store_id}", store_id), None, False)
+            for template, (kind, method, _) in self.templates.items()
+            if kind == "layout" and "{floor}" not in template
+        ]
+
+    def asset_requests(self, store_id, floors=None):
+        """
+        Requests for every non-layout asset of a store.
+
+        Floor templates are expanded for each floor in the layout, falling
+        back to the floors seen in the capture.
+        """
+        requests = []
+        for template, (kind, method, captured_floors) in self.templates.items():
+            if kind == "layout" and "{floor}" not in template:
+                continue
+
+            url = template.replace("{store_id}", store_id)
+            if "{floor}" not in url:
+                requests.append(AssetRequest(kind, method, url, None, kind == "shared"))
+                continue
+
+            for floor in floors or sorted(captured_floors):
+                requests.append(AssetRequest(kind, method, url.replace("{floor}", floor), floor, False))
+
+        return requests
+
+
+class SharedAssetCache:
+    """
+    Single-flight cache for assets shared between stores.
+
+    The first store to need an asset downloads it; concurrent and later
+    stores reuse the same result.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get_or_fetch(self, url, fetch):
+        """Return the cached result for url, calling fetch(url) only once."""
+        with self._lock:
+            future = self._futures.get(url)
+            if future is not None:
+                self.hits += 1
+                owner = False
+            else:
+                future = self._futures[url] = Future()
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(fetch(url))
+        except Exception as e:
+            future.set_exception(e)
+            with self._lock:
+                # Let a later store retry a failed shared asset
+                del self._futures[url]
+        return future.result()
+
+
+def stream_to_file(response, directory, chunk_size=CHUNK_SIZE):
+    """
+    Stream a response body into a content-addressed file.
+
+    The body is read chunk by chunk (requests undoes any gzip/deflate
+    Content-Encoding as it goes), hashed and written to a temp file that
+    is renamed to its SHA-256 once complete, so a partial download never
+    looks like a finished asset.
+
+    Returns (sha256, size).
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".partial-", delete=False) as f:
+        try:
+            for chunk in response.iter_content(chunk_size):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+
+    sha256 = digest.hexdigest()
+    os.replace(f.name, directory / sha256)
+    return sha256, size
+
+
+class AssetFetcher:
+    """Fetch a store's planned assets concurrently and assemble the map."""
+
+    def __init__(self, request, shared_cache=None, workers=8, asset_dir=ASSET_DIR, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            request: Callable (method, url, **kwargs) -> requests.Response,
+                normally StoreMapDownloader.request so auth and rate
+                limiting apply. Called with stream=True.
+            shared_cache: SharedAssetCache shared by every store in a crawl.
+            workers: Concurrent asset downloads per store.
+            asset_dir: Directory for content-addressed asset bodies; body
+                paths in the map are relative to its parent.
+            chunk_size: Bytes read per chunk while streaming a body.
+        """
+        self.request = request
+        self.shared_cache = shared_cache or SharedAssetCache()
+        self.workers = workers
+        self.asset_dir = Path(asset_dir)
+        self.chunk_size = chunk_size
+
+    def _fetch(self, asset):
+        response = self.request(asset.method, asset.url, stream=True)
+        try:
+            response.raise_for_status()
+            sha256, size = stream_to_file(response, self.asset_dir, self.chunk_size)
+        finally:
+            response.close()
+        return {
+            "content_type": response.headers.get("Content-Type", ""),
+            "sha256": sha256,
+            "size": size,
+            "body_file": f"{self.asset_dir.name}/{sha256}"
+        }
+
+    def _metadata(self, body):
+        if "error" in body or "json" not in body["content_type"]:
+            return {}
+        return extract_metadata_from_file(self.asset_dir / body["sha256"])
+
+    def _fetch_asset(self, asset):
+        if asset.shared:
+            return self.shared_cache.get_or_fetch(asset.url, lambda _: self._fetch(asset))
+        return self._fetch(asset)
+
+    def _fetch_or_error(self, asset):
+        # HTTP errors, a token that can't be refreshed and failures writing
+        # the body to disk all only cost this asset
+        try:
+            return self._fetch_asset(asset)
+        except (requests.RequestException, TokenRefreshError, OSError) as e:
+            return {"error": str(e)}
+
+    def fetch_many(self, assets, record_errors=False):
+        """
+        Fetch assets in parallel; returns (asset, body) pairs in plan order.
+
+        With record_errors=True a failed asset gets {"error": message} as
+        its body instead of failing the whole batch.
+        """
+        if not assets:
+            return []
+        fetch = self._fetch_or_error if record_errors else self._fetch_asset
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(assets))) as executor:
+            return list(zip(assets, executor.map(fetch, assets)))
+
+    def fetch_store(self, planner, store_id):
+        """
+        Fetch every asset of one store and assemble the map document.
+
+        Returns (map, metadata) where metadata holds the floors, sections
+        and aisles found in the layout and POI assets. Assets that failed
+        carry an "error" instead of a body.
+        """
+        layouts = self.fetch_many(planner.layout_requests(store_id))
+
+        metadata = {key: [] for key in METADATA_KEYS}
+        for _, body in layouts:
+            for key, value in self._metadata(body).items():
+                metadata[key] = metadata[key] or value
+
+        # The layout is required; a missing tile or per-floor POI list is
+        # recorded on the asset instead of failing the store
+        assets = self.fetch_many(planner.asset_requests(store_id, floor_ids(metadata["floors"])), record_errors=True)
+
+        # Per-floor POI lists carry the sections/aisles the layout omits;
+        # merge them across floors, tagging items with their floor
+        from_layout = {key for key, value in metadata.items() if value}
+        for asset, body in assets:
+            if asset.kind not in ("pois", "floors"):
+                continue
+            for key, items in self._metadata(body).items():
+                if key in from_layout:
+                    continue
+                for item in items:
+                    if isinstance(item, dict) and asset.floor is not None:
+                        item.setdefault("floor", asset.floor)
+                    metadata[key].append(item)
+
+        return {
+            "format": "assets",
+            "layout": [{"url": asset.url, **body} for asset, body in layouts],
+            "assets": [
+                {"kind": asset.kind, "url": asset.url, "floor": asset.floor, "shared": asset.shared, **body}
+                for asset, body in assets
+            ]
+        }, metadata
@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""
+Diff saved store maps with Merkle-style structural hashes.
+
+Each saved map (store_<id>_<timestamp>.json from save_map) is hashed as
+a tree: aisles under their section, sections under their floor, floors
+and map assets under the root. A subtree's hash covers everything below
+it, so when two versions share a floor hash that whole floor is skipped
+without looking at its sections or aisles.
+
+The resulting change set lists added, removed, modified and moved
+entities (an aisle is "moved" when its floor, section or outline
+changes). Deltas carry the new content of every changed entity, so
+apply_delta(base, delta) rebuilds the newer map and older full
+snapshots can be replaced by their deltas.
+
+Usage:
+    python map_diff.py diff data/maps/store_T-1234_20250101_120000.json data/maps/store_T-1234_latest.json
+    python map_diff.py fleet --workers 8
+    python map_diff.py fleet --compact   # replace older snapshots with deltas
+    python map_diff.py rebuild data/maps/store_T-1234_20250101_120000.json --until 20250301_090000
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import re
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+console = Console()
+
+MAPS_DIR = Path("data/maps")
+SNAPSHOT_NAME = re.compile(r"^store_(?P<store>.+)_(?P<timestamp>\d{8}_\d{6})\.json$")
+
+COLLECTIONS = ["floors", "sections", "aisles"]
+# Fields describing where an aisle is; changing any of them is a move
+LOCATION_FIELDS = ["floor", "section", "section_id", "geometry", "polygon", "outline", "coordinates", "points", "x", "y"]
+UNASSIGNED = "_unassigned"
+
+
+def digest(value):
+    """Hash a JSON-compatible value independent of key order."""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _combine(*parts):
+    return hashlib.sha256("|".join(parts).encode("ascii")).hexdigest()
+
+
+def entity_id(entity, position):
+    """Stable identifier for a floor/section/aisle."""
+    if isinstance(entity, dict):
+        for key in ("id", "name"):
+            if entity.get(key) is not None:
+                return str(entity[key])
+    return f"#{position}"
+
+
+def _ref(entity, *keys):
+    for key in keys:
+        if isinstance(entity, dict) and entity.get(key) is not None:
+            return str(entity[key])
+    return None
+
+
+def _entities(map_data, collection):
+    """
+    Entities keyed by entity_id.
+
+    Entities sharing an ID or name (e.g. aisle "X" on two floors) are
+    qualified with their floor and section, then numbered in document
+    order, so no entity is dropped from the tree.
+    """
+    items = map_data.get("metadata", {}).get(collection, [])
+    keys = [entity_id(item, i) for i, item in enumerate(items)]
+    counts = defaultdict(int)
+    for key in keys:
+        counts[key] += 1
+
+    entities = {}
+    for key, item in zip(keys, items):
+        if counts[key] > 1:
+            key = f"{key}@{_ref(item, 'floor', 'floor_id')}/{_ref(item, 'section', 'section_id')}"
+        unique, n = key, 2
+        while unique in entities:
+            unique, n = f"{key}#{n}", n + 1
+        entities[unique] = item
+    return entities
+
+
+def _document_header(map_data):
+    """Top-level fields and non-collection metadata, which also need diffing."""
+    header = {
+        key: value for key, value in map_data.items()
+        if key not in ("map", "metadata", "downloaded_at")
+    }
+    metadata = map_data.get("metadata") or {}
+    header["metadata"] = {key: value for key, value in metadata.items() if key not in COLLECTIONS}
+    return header
+
+
+def _assets(map_data):
+    """Map assets keyed by URL (layout documents and fetched sub-resources)."""
+    map_body = map_data.get("map") or {}
+    assets = {}
+    if isinstance(map_body, dict):
+        for group in ("layout", "assets"):
+            for asset in map_body.get(group) or []:
+                assets[f"{group}:{asset.get('url')}"] = asset
+    return assets
+
+
+def _map_header(map_data):
+    """Non-asset map fields (format, inline data) that still need diffing."""
+    map_body = map_data.get("map") or {}
+    if not isinstance(map_body, dict):
+        return map_body
+    return {key: value for key, value in map_body.items() if key not in ("layout", "assets")}
+
+
+class MapTree:
+    """Merkle tree over one saved map."""
+
+    def __init__(self, map_data):
+        self.entities = {collection: _entities(map_data, collection) for collection in COLLECTIONS}
+        self.assets = _assets(map_data)
+        self.header = _map_header(map_data)
+        self.document = _document_header(map_data)
+
+        self.leaf = {
+            collection: {key: digest(entity) for key, entity in entities.items()}
+            for collection, entities in self.entities.items()
+        }
+        self.asset_hashes = {key: digest(asset) for key, asset in self.assets.items()}
+
+        # Group aisles under sections and sections under floors
+        self.section_floor = {
+            key: _ref(section, "floor", "floor_id") or UNASSIGNED
+            for key, section in self.entities["sections"].items()
+        }
+        self.aisle_parent = {}
+        for key, aisle in self.entities["aisles"].items():
+            section = _ref(aisle, "section", "section_id")
+            floor = _ref(aisle, "floor", "floor_id") or self.section_floor.get(section) or UNASSIGNED
+            self.aisle_parent[key] = (floor, section or UNASSIGNED)
+
+        self.section_aisles = defaultdict(list)
+        for key, (floor, section) in self.aisle_parent.items():
+            self.section_aisles[(floor, section)].append(key)
+
+        floor_keys = set(self.entities["floors"]) | set(self.section_floor.values())
+        floor_keys |= {floor for floor, _ in self.aisle_parent.values()}
+        self.floor_sections = defaultdict(set)
+        for (floor, section) in self.section_aisles:
+            self.floor_sections[floor].add(section)
+        for section, floor in self.section_floor.items():
+            self.floor_sections[floor].add(section)
+
+        self.section_hash = {}
+        for floor in floor_keys:
+            for section in self.floor_sections[floor]:
+                aisle_hashes = sorted(self.leaf["aisles"][a] for a in self.section_aisles[(floor, section)])
+                own = self.leaf["sections"].get(section, "") if self.section_floor.get(section) == floor else ""
+                self.section_hash[(floor, section)] = _combine(own, *aisle_hashes)
+
+        self.floor_hash = {
+            floor: _combine(
+                self.leaf["floors"].get(floor, ""),
+                *sorted(self.section_hash[(floor, section)] for section in self.floor_sections[floor])
+            )
+            for floor in floor_keys
+        }
+        self.assets_hash = _combine(*sorted(self.asset_hashes.values()))
+        self.root = _combine(
+            digest(self.document),
+            digest(self.header),
+            self.assets_hash,
+            *sorted(f"{floor}={h}" for floor, h in self.floor_hash.items())
+        )
+
+
+def _empty_changes():
+    return {"added": [], "removed": [], "modified": []}
+
+
+def _diff_leaves(collection, keys, old, new, changes):
+    for key in keys:
+        old_hash = old.leaf[collection].get(key)
+        new_hash = new.leaf[collection].get(key)
+        if old_hash == new_hash:
+            continue
+        if old_hash is None:
+            changes[collection]["added"].append({"id": key, "entity": new.entities[collection][key]})
+        elif new_hash is None:
+            changes[collection]["removed"].append(key)
+        else:
+            changes[collection]["modified"].append({"id": key, "entity": new.entities[collection][key]})
+
+
+def diff_maps(old_map, new_map):
+    """
+    Compute the change set turning old_map into new_map.
+
+    Floors and sections whose subtree hash is unchanged are skipped
+    without visiting their children.
+    """
+    old, new = MapTree(old_map), MapTree(new_map)
+    delta = {
+        "store_id": new_map.get("store_id", old_map.get("store_id")),
+        "base_hash": old.root,
+        "target_hash": new.root,
+        "downloaded_at": new_map.get("downloaded_at"),
+        "changes": {collection: _empty_changes() for collection in COLLECTIONS + ["assets"]}
+    }
+    delta["changes"]["aisles"]["moved"] = []
+    if old.root == new.root:
+        return delta
+
+    changes = delta["changes"]
+    if digest(old.document) != digest(new.document):
+        delta["document_header"] = new.document
+    if digest(old.header) != digest(new.header):
+        delta["map_header"] = new.header
+
+    if old.assets_hash != new.assets_hash:
+        for key in set(old.asset_hashes) | set(new.asset_hashes):
+            old_hash, new_hash = old.asset_hashes.get(key), new.asset_hashes.get(key)
+            if old_hash == new_hash:
+                continue
+            if old_hash is None:
+                changes["assets"]["added"].append({"id": key, "entity": new.assets[key]})
+            elif new_hash is None:
+                changes["assets"]["removed"].append(key)
+            else:
+                changes["assets"]["modified"].append({"id": key, "entity": new.assets[key]})
+
+    touched = {collection: set() for collection in COLLECTIONS}
+    for floor in set(old.floor_hash) | set(new.floor_hash):
+        if old.floor_hash.get(floor) == new.floor_hash.get(floor):
+            continue
+        touched["floors"].add(floor)
+        for section in old.floor_sections.get(floor, set()) | new.floor_sections.get(floor, set()):
+            if old.section_hash.get((floor, section)) == new.section_hash.get((floor, section)):
+                continue
+            touched["sections"].add(section)
+            touched["aisles"].update(old.section_aisles.get((floor, section), []))
+            touched["aisles"].update(new.section_aisles.get((floor, section), []))
+
+    touched["floors"] &= set(old.leaf["floors"]) | set(new.leaf["floors"])
+    touched["sections"] &= set(old.leaf["sections"]) | set(new.leaf["sections"])
+    for collection in COLLECTIONS:
+        _diff_leaves(collection, sorted(touched[collection]), old, new, changes)
+
+    # Split aisle modifications into moves and in-place edits
+    still_modified = []
+    for change in changes["aisles"]["modified"]:
+        key, aisle = change["id"], change["entity"]
+        before = old.entities["aisles"][key]
+        moved = not isinstance(aisle, dict) or not isinstance(before, dict)
+        moved = moved or any(before.get(field) != aisle.get(field) for field in LOCATION_FIELDS)
+        moved = moved or old.aisle_parent[key] != new.aisle_parent[key]
+        if moved:
+            changes["aisles"]["moved"].append({
+                "id": key,
+                "from": dict(zip(("floor", "section"), old.aisle_parent[key])),
+                "to": dict(zip(("floor", "section"), new.aisle_parent[key])),
+                "entity": aisle
+            })
+        else:
+            still_modified.append(change)
+    changes["aisles"]["modified"] = still_modified
+
+    return delta
+
+
+def is_empty(delta):
+    return delta["base_hash"] == delta["target_hash"]
+
+
+def apply_delta(base_map, delta):
+    """Rebuild the newer map from an older map and the delta between them."""
+    result = copy.deepcopy(base_map)
+    if is_empty(delta):
+        return result
+
+    changes = delta["changes"]
+    if "document_header" in delta:
+        document = dict(delta["document_header"])
+        extra_metadata = document.pop("metadata", {})
+        for key in [key for key in result if key not in ("map", "metadata", "downloaded_at")]:
+            del result[key]
+        result.update(document)
+        collections = {key: value for key, value in (result.get("metadata") or {}).items() if key in COLLECTIONS}
+        result["metadata"] = {**extra_metadata, **collections}
+
+    metadata = result.setdefault("metadata", {})
+    for collection in COLLECTIONS:
+        current = _entities(result, collection)
+        for key in changes[collection]["removed"]:
+            current.pop(key, None)
+        updated = changes[collection]["added"] + changes[collection]["modified"]
+        if collection == "aisles":
+            updated += changes["aisles"]["moved"]
+        for change in updated:
+            current[change["id"]] = change["entity"]
+        metadata[collection] = list(current.values())
+
+    if "map_header" in delta or any(changes["assets"].values()):
+        map_body = result.get("map") if isinstance(result.get("map"), dict) else {}
+        assets = _assets(result)
+        for key in changes["assets"]["removed"]:
+            assets.pop(key, None)
+        for change in changes["assets"]["added"] + changes["assets"]["modified"]:
+            assets[change["id"]] = change["entity"]
+
+        header = delta.get("map_header", _map_header(result))
+        map_body = dict(header) if isinstance(header, dict) else header
+        if isinstance(map_body, dict):
+            for group in ("layout", "assets"):
+                items = [asset for key, asset in assets.items() if key.startswith(f"{group}:")]
+                if items:
+                    map_body[group] = items
+        result["map"] = map_body
+
+    result["downloaded_at"] = delta.get("downloaded_at", result.get("downloaded_at"))
+    if MapTree(result).root != delta["target_hash"]:
+        raise ValueError("Delta does not apply cleanly to this base map")
+    return result
+
+
+def summarize(delta):
+    """Counts of each change type, e.g. {'aisles.moved': 2}."""
+    counts = {}
+    for collection, kinds in delta["changes"].items():
+        for kind, items in kinds.items():
+            if items:
+                counts[f"{collection}.{kind}"] = len(items)
+    return counts
+
+
+def find_snapshots(maps_dir=MAPS_DIR):
+    """Return {store_id: [snapshot paths, oldest first]}."""
+    snapshots = defaultdict(list)
+    for path in Path(maps_dir).glob("store_*.json"):
+        match = SNAPSHOT_NAME.match(path.name)
+        if match:
+            snapshots[match.group("store")].append((match.group("timestamp"), path))
+    return {store: [path for _, path in sorted(paths)] for store, paths in snapshots.items()}
+
+
+def delta_path(old_path, new_path):
+    old_ts = SNAPSHOT_NAME.match(old_path.name).group("timestamp")
+    new_match = SNAPSHOT_NAME.match(new_path.name)
+    deltas_dir = new_path.parent / "deltas"
+    return deltas_dir / f"store_{new_match.group('store')}_{old_ts}_to_{new_match.group('timestamp')}.delta.json"
+
+
+def canonical_digest(map_data):
+    """
+    Hash a whole map, ignoring the order of entities and assets.
+
+    Used to check that a rebuilt map matches its snapshot independently
+    of the entity keys MapTree uses.
+    """
+    normalized = dict(map_data)
+    metadata = dict(map_data.get("metadata") or {})
+    for collection in COLLECTIONS:
+        metadata[collection] = sorted(digest(item) for item in metadata.get(collection) or [])
+    normalized["metadata"] = metadata
+    map_body = map_data.get("map")
+    if isinstance(map_body, dict):
+        normalized["map"] = dict(map_body)
+        for group in ("layout", "assets"):
+            normalized["map"][group] = sorted(digest(asset) for asset in map_body.get(group) or [])
+    return digest(normalized)
+
+
+def replay_chain(base_path):
+    """Yield (timestamp, map) for each version reached by applying stored deltas to a base snapshot."""
+    base_path = Path(base_path)
+    match = SNAPSHOT_NAME.match(base_path.name)
+    with open(base_path, 'r') as f:
+        current = json.load(f)
+
+    timestamp = match.group("timestamp")
+    deltas_dir = base_path.parent / "deltas"
+    while True:
+        candidates = sorted(deltas_dir.glob(f"store_{match.group('store')}_{timestamp}_to_*.delta.json"))
+        if not candidates:
+            return
+        with open(candidates[0], 'r') as f:
+            current = apply_delta(current, json.load(f))
+        timestamp = candidates[0].name.split("_to_")[1].split(".")[0]
+        yield timestamp, current
+
+
+def _chain_reproduces(paths):
+    """True if replaying deltas from paths[0] reproduces every later snapshot exactly."""
+    expected = {SNAPSHOT_NAME.match(path.name).group("timestamp"): path for path in paths[1:]}
+    try:
+        for timestamp, rebuilt in replay_chain(paths[0]):
+            path = expected.pop(timestamp, None)
+            if path is None:
+                continue
+            with open(path, 'r') as f:
+                if canonical_digest(rebuilt) != canonical_digest(json.load(f)):
+                    return False
+            if not expected:
+                return True
+    except ValueError:
+        return False
+    return not expected
+
+
+def diff_store_history(paths, compact=False):
+    """
+    Diff consecutive snapshots of one store and write each delta.
+
+    With compact=True every snapshot except the oldest and the newest is
+    deleted, but only once replaying the deltas from the oldest snapshot
+    reproduces each of them exactly.
+
+    Returns a list of (delta path, summary) tuples.
+    """
+    results = []
+    previous_path = paths[0]
+    store = SNAPSHOT_NAME.match(previous_path.name).group("store")
+    with open(previous_path, 'r') as f:
+        previous = json.load(f)
+
+    for path in paths[1:]:
+        with open(path, 'r') as f:
+            current = json.load(f)
+
+        # After compaction the chain already reaches this snapshot through
+        # deleted intermediates; a shortcut delta would be redundant
+        new_ts = SNAPSHOT_NAME.match(path.name).group("timestamp")
+        output = delta_path(previous_path, path)
+        if not any(output.parent.glob(f"store_{store}_????????_??????_to_{new_ts}.delta.json")):
+            delta = diff_maps(previous, current)
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with open(output, 'w') as f:
+                json.dump(delta, f, separators=(",", ":"))
+            results.append((str(output), summarize(delta)))
+
+        previous_path, previous = path, current
+
+    if compact and len(paths) > 2:
+        if not _chain_reproduces(paths):
+            console.print(f"[yellow]⚠ {store}: deltas do not reproduce every snapshot, not compacting[/yellow]")
+            return results
+        # Deltas chain forward from the oldest snapshot, so it has to stay
+        for path in paths[1:-1]:
+            path.unlink()
+
+    return results
+
+
+def diff_fleet(maps_dir=MAPS_DIR, workers=None, compact=False):
+    """Diff every store's snapshot history in parallel processes."""
+    snapshots = {store: paths for store, paths in find_snapshots(maps_dir).items() if len(paths) > 1}
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(diff_store_history, paths, compact): store
+            for store, paths in snapshots.items()
+        }
+        for future in as_completed(futures):
+            store = futures[future]
+            try:
+                results[store] = future.result()
+            except Exception as e:
+                console.print(f"[red]✗ {store}: {e}[/red]")
+                results[store] = None
+    return results
+
+
+def rebuild(base_path, until=None):
+    """
+    Replay stored deltas on top of a base snapshot.
+
+    Returns (map, timestamp) of the last version at or before `until`
+    (the latest version if None); the base itself if it is already later.
+    """
+    base_path = Path(base_path)
+    with open(base_path, 'r') as f:
+        current = json.load(f)
+
+    timestamp = SNAPSHOT_NAME.match(base_path.name).group("timestamp")
+    if until is not None and timestamp >= until:
+        return current, timestamp
+    for next_timestamp, next_map in replay_chain(base_path):
+        if until is not None and next_timestamp > until:
+            break
+        timestamp, current = next_timestamp, next_map
+    return current, timestamp
+
+
+def main():
+    """Diff saved store maps."""
+    parser = argparse.ArgumentParser(description="Diff saved Target store maps")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    diff = subparsers.add_parser("diff", help="Diff two saved maps")
+    diff.add_argument("old_map")
+    diff.add_argument("new_map")
+    diff.add_argument("--output", help="Write the delta to this file")
+
+    fleet = subparsers.add_parser("fleet", help="Diff every store's snapshot history")
+    fleet.add_argument("--maps-dir", default=str(MAPS_DIR))
+    fleet.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    fleet.add_argument("--compact", action="store_true", help="Delete intermediate snapshots once deltas exist")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild a map version from a base snapshot and deltas")
+    rebuild_parser.add_argument("base_map")
+    rebuild_parser.add_argument("--until", help="Rebuild the last version at or before this timestamp (YYYYMMDD_HHMMSS)")
+    rebuild_parser.add_argument("--output", help="Write the rebuilt map to this file")
+
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        with open(args.old_map, 'r') as f:
+            old_map = json.load(f)
+        with open(args.new_map, 'r') as f:
+            new_map = json.load(f)
+        delta = diff_maps(old_map, new_map)
+
+        if is_empty(delta):
+            console.print("[green]✓ Maps are identical[/green]\n")
+        else:
+            table = Table(title="Map Changes", box=box.ROUNDED)
+            table.add_column("Change", style="cyan")
+            table.add_column("Count", style="magenta")
+            for change, count in summarize(delta).items():
+                table.add_row(change, str(count))
+            console.print(table)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(delta, f, indent=2)
+            console.print(f"[green]✓ Delta saved to: {args.output}[/green]\n")
+
+    elif args.command == "fleet":
+        results = diff_fleet(args.maps_dir, args.workers, args.compact)
+        written = sum(len(deltas) for deltas in results.values() if deltas)
+        changed = sum(1 for deltas in results.values() if deltas and any(summary for _, summary in deltas))
+        console.print(f"[green]✓ {len(results)} stores diffed, {written} new deltas, {changed} stores changed[/green]\n")
+        return 1 if any(deltas is None for deltas in results.values()) else 0
+
+    else:
+        rebuilt, timestamp = rebuild(args.base_map, args.until)
+        output = args.output or f"store_{rebuilt.get('store_id')}_{timestamp}.rebuilt.json"
+        with open(output, 'w') as f:
+            json.dump(rebuilt, f, indent=2)
+        console.print(f"[green]✓ Rebuilt map as of {timestamp}: {output}[/green]\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Vectorized geometry for downloaded store maps.
+
+Map metadata stores floors, sections and aisles as nested lists/dicts.
+GeometryBuffer flattens every outline into contiguous NumPy arrays so
+per-store geometry work runs as a handful of array operations instead of
+Python loops over every vertex:
+
+- coords:          (N, 2) float64, all ring vertices back to back
+- ring_offsets:    (R + 1,) start of each ring in coords
+- ring_feature:    (R,) feature index owning each ring
+- ring_is_hole:    (R,) True for polygon holes
+- feature_offsets: (F + 1,) first ring of each feature
+
+Outlines are read from a feature's "geometry" (GeoJSON Polygon or
+MultiPolygon) or from a plain "polygon"/"outline"/"coordinates"/"points"
+list of [x, y] pairs or {"x", "y"} dicts.
+
+Usage:
+    python map_geometry.py data/maps/store_T-1234_latest.json
+
+    geometry = GeometryBuffer.from_map_data(map_data)
+    areas = geometry.areas()
+    aisle_index = geometry.locate([[12.5, 40.0]], kind="aisle")
+    latlng = geometry.transform(local_to_latlng_matrix(44.97, -93.26))
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+console = Console()
+
+FEATURE_KINDS = [("floors", "floor"), ("sections", "section"), ("aisles", "aisle")]
+OUTLINE_KEYS = ["polygon", "outline", "coordinates", "points"]
+
+# Meters per degree of latitude (WGS84 mean)
+METERS_PER_DEGREE = 111320.0
+
+
+def _as_ring(points):
+    """
+    Convert a list of [x, y] pairs or {"x", "y"} dicts to an (n, 2) array.
+
+    Returns None for anything that isn't a ring of at least three
+    complete points, so one malformed outline can't sink a whole map.
+    """
+    if not isinstance(points, (list, tuple)):
+        return None
+    if points and isinstance(points[0], dict):
+        if not all(isinstance(p, dict) for p in points):
+            return None
+        points = [(p.get("x", p.get("lng")), p.get("y", p.get("lat"))) for p in points]
+    try:
+        ring = np.asarray(points, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if ring.ndim != 2 or ring.shape[0] < 3 or ring.shape[1] < 2 or np.isnan(ring[:, :2]).any():
+        return None
+    return ring[:, :2]
+
+
+def feature_polygons(feature):
+    """Return a feature's polygons as lists of rings (exterior first)."""
+    geometry = feature.get("geometry")
+    if isinstance(geometry, dict):
+        coordinates = geometry.get("coordinates")
+        if not isinstance(coordinates, list):
+            return []
+        if geometry.get("type") == "Polygon":
+            return [coordinates]
+        if geometry.get("type") == "MultiPolygon":
+            return [polygon for polygon in coordinates if isinstance(polygon, list)]
+        return []
+
+    for key in OUTLINE_KEYS:
+        outline = feature.get(key)
+        # A lone point ({"x": 1, "y": 2}) or other non-sequence isn't an outline
+        if outline and isinstance(outline, (list, tuple)):
+            # A single ring, or a GeoJSON-style list of rings
+            if isinstance(outline[0], (list, tuple)) and outline[0] and isinstance(outline[0][0], (list, tuple)):
+                return [outline]
+            return [[outline]]
+    return []
+
+
+class GeometryBuffer:
+    """Contiguous ring buffers plus batched geometry operations."""
+
+    def __init__(self, coords, ring_offsets, ring_feature, ring_is_hole, feature_ids, feature_kinds, feature_floors):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.ring_feature = ring_feature
+        self.ring_is_hole = ring_is_hole
+        self.feature_ids = feature_ids
+        self.feature_kinds = np.asarray(feature_kinds, dtype=object)
+        self.feature_floors = np.asarray(feature_floors, dtype=object)
+
+        # Rings of a feature are contiguous, so features can use reduceat too
+        counts = np.bincount(ring_feature, minlength=len(feature_ids))
+        self.feature_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        # Index of the next vertex within the same ring (wrapping around)
+        self._next = np.arange(1, len(coords) + 1, dtype=np.int64)
+        if len(ring_offsets) > 1:
+            self._next[ring_offsets[1:] - 1] = ring_offsets[:-1]
+
+    @classmethod
+    def from_map_data(cls, map_data):
+        """Build a buffer from the floors/sections/aisles in map_data["metadata"]."""
+        metadata = map_data.get("metadata", map_data)
+        rings, ring_feature, ring_is_hole = [], [], []
+        feature_ids, feature_kinds, feature_floors = [], [], []
+
+        for key, kind in FEATURE_KINDS:
+            for feature in metadata.get(key, []):
+                if not isinstance(feature, dict):
+                    continue
+                feature_rings = []
+                for polygon in feature_polygons(feature):
+                    for position, points in enumerate(polygon):
+                        ring = _as_ring(points)
+                        if ring is not None:
+                            feature_rings.append((ring, position > 0))
+                if not feature_rings:
+                    continue
+
+                index = len(feature_ids)
+                feature_ids.append(feature.get("id", feature.get("name")))
+                feature_kinds.append(kind)
+                feature_floors.append(feature.get("floor", feature.get("id") if kind == "floor" else None))
+                for ring, is_hole in feature_rings:
+                    rings.append(ring)
+                    ring_feature.append(index)
+                    ring_is_hole.append(is_hole)
+
+        lengths = np.fromiter((len(r) for r in rings), dtype=np.int64, count=len(rings))
+        return cls(
+            coords=np.concatenate(rings) if rings else np.empty((0, 2)),
+            ring_offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            ring_feature=np.asarray(ring_feature, dtype=np.int64),
+            ring_is_hole=np.asarray(ring_is_hole, dtype=bool),
+            feature_ids=feature_ids,
+            feature_kinds=feature_kinds,
+            feature_floors=feature_floors
+        )
+
+    def __len__(self):
+        return len(self.feature_ids)
+
+    def _reduce_rings(self, values):
+        """Sum a per-ring array into a per-feature array."""
+        if len(values) == 0:
+            return np.zeros(len(self))
+        return np.add.reduceat(values, self.feature_offsets[:-1])
+
+    def _cross(self):
+        """Per-vertex shoelace terms x_i * y_{i+1} - x_{i+1} * y_i."""
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        return x * y[self._next] - x[self._next] * y
+
+    def ring_signed_areas(self):
+        """Signed area of each ring (positive when counter-clockwise)."""
+        if len(self.coords) == 0:
+            return np.zeros(0)
+        return np.add.reduceat(self._cross(), self.ring_offsets[:-1]) / 2.0
+
+    def _ring_weights(self, signed_areas):
+        # Exteriors count positive and holes negative, whatever the winding
+        orientation = np.sign(signed_areas)
+        return np.where(self.ring_is_hole, -orientation, orientation)
+
+    def areas(self):
+        """Area of each feature, holes subtracted."""
+        signed = self.ring_signed_areas()
+        return self._reduce_rings(signed * self._ring_weights(signed))
+
+    def bounds(self):
+        """Bounding box of each feature as an (F, 4) array of minx, miny, maxx, maxy."""
+        if len(self.coords) == 0:
+            return np.zeros((0, 4))
+        vertex_offsets = self.ring_offsets[self.feature_offsets[:-1]]
+        return np.column_stack([
+            np.minimum.reduceat(self.coords[:, 0], vertex_offsets),
+            np.minimum.reduceat(self.coords[:, 1], vertex_offsets),
+            np.maximum.reduceat(self.coords[:, 0], vertex_offsets),
+            np.maximum.reduceat(self.coords[:, 1], vertex_offsets)
+        ])
+
+    def centroids(self):
+        """Area-weighted centroid of each feature as an (F, 2) array."""
+        if len(self.coords) == 0:
+            return np.zeros((0, 2))
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        cross = self._cross()
+        starts = self.ring_offsets[:-1]
+
+        signed = np.add.reduceat(cross, starts) / 2.0
+        weights = self._ring_weights(signed)
+        cx = np.add.reduceat((x + x[self._next]) * cross, starts) * weights
+        cy = np.add.reduceat((y + y[self._next]) * cross, starts) * weights
+
+        area = self._reduce_rings(signed * self._ring_weights(signed))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.column_stack([self._reduce_rings(cx), self._reduce_rings(cy)]) / (6.0 * area[:, None])
+
+    def contains(self, points):
+        """
+        Point-in-polygon test for many points against every feature.
+
+        Returns an (M, F) boolean array.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        result = np.zeros((len(points), len(self)), dtype=bool)
+        point_index, feature_index = self.containing_pairs(points)
+        result[point_index, feature_index] = True
+        return result
+
+    def containing_pairs(self, points, feature_mask=None, chunk_size=1_000_000):
+        """
+        Sparse point-in-polygon test.
+
+        Candidate (point, feature) pairs are found with a bounding-box test;
+        only their edges are then checked with even-odd ray casting, so
+        holes and multi-polygons need no special handling. Points are
+        processed in chunks so the (points x features) box test stays under
+        chunk_size elements.
+
+        Returns (point_index, feature_index) arrays of every containing pair.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        found_points, found_features = [], []
+        if len(self.coords) == 0 or len(points) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        candidates = np.arange(len(self)) if feature_mask is None else np.flatnonzero(feature_mask)
+        bounds = self.bounds()[candidates]
+        x1, y1 = self.coords[:, 0], self.coords[:, 1]
+        x2, y2 = x1[self._next], y1[self._next]
+        slope = np.divide(x2 - x1, y2 - y1, out=np.zeros_like(x1), where=y2 != y1)
+        edge_starts = self.ring_offsets[self.feature_offsets[:-1]][candidates]
+        edge_counts = self.ring_offsets[self.feature_offsets[1:]][candidates] - edge_starts
+
+        step = max(1, chunk_size // max(len(candidates), 1))
+        for start in range(0, len(points), step):
+            chunk = points[start:start + step]
+            px, py = chunk[:, 0:1], chunk[:, 1:2]
+            in_box = (px >= bounds[:, 0]) & (px <= bounds[:, 2]) & (py >= bounds[:, 1]) & (py <= bounds[:, 3])
+            point_index, feature_index = np.nonzero(in_box)
+            if len(point_index) == 0:
+                continue
+
+            # Flatten every candidate pair's edges into one run per pair
+            counts = edge_counts[feature_index]
+            pair_starts = np.cumsum(counts) - counts
+            pair = np.repeat(np.arange(len(counts)), counts)
+            edges = np.repeat(edge_starts[feature_index] - pair_starts, counts) + np.arange(counts.sum())
+
+            qx, qy = chunk[point_index[pair], 0], chunk[point_index[pair], 1]
+            crosses = ((y1[edges] > qy) != (y2[edges] > qy)) & (qx < x1[edges] + (qy - y1[edges]) * slope[edges])
+            inside = np.add.reduceat(crosses.astype(np.int64), pair_starts) % 2 == 1
+            found_points.append(start + point_index[inside])
+            found_features.append(candidates[feature_index[inside]])
+
+        if not found_points:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(found_points), np.concatenate(found_features)
+
+    def locate(self, points, kind="aisle", floor=None):
+        """
+        Index of the feature of the given kind containing each point, or -1.
+
+        Floors share local coordinates, so in multi-level stores pass floor
+        to only consider features on that floor (compared as stored in the
+        map). When features overlap, the smallest one wins (an aisle rather
+        than the section around it when kind is None).
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        mask = np.ones(len(self), dtype=bool)
+        if kind is not None:
+            mask &= self.feature_kinds == kind
+        if floor is not None:
+            mask &= self.feature_floors == floor
+        point_index, feature_index = self.containing_pairs(points, mask)
+
+        # Sort pairs by area descending so the smallest feature is written last
+        order = np.argsort(-self.areas()[feature_index], kind="stable")
+        result = np.full(len(points), -1, dtype=np.int64)
+        result[point_index[order]] = feature_index[order]
+        return result
+
+    def transform(self, matrix):
+        """
+        Return a copy with every vertex mapped through a 2x3 affine matrix.
+
+        [[a, b, tx], [c, d, ty]] maps (x, y) to (a*x + b*y + tx, c*x + d*y + ty).
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        coords = self.coords @ matrix[:, :2].T + matrix[:, 2]
+        return GeometryBuffer(
+            coords, self.ring_offsets, self.ring_feature, self.ring_is_hole,
+            self.feature_ids, list(self.feature_kinds), list(self.feature_floors)
+        )
+
+
+def local_to_latlng_matrix(origin_lat, origin_lng, rotation_deg=0.0, meters_per_unit=1.0):
+    """
+    Affine matrix mapping local map units to (lng, lat).
+
+    Local x points east and y north after rotating by rotation_deg
+    (counter-clockwise); the equirectangular approximation is accurate
+    to well under a meter over a store-sized area.
+    """
+    theta = np.radians(rotation_deg)
+    cos, sin = np.cos(theta), np.sin(theta)
+    lat_scale = meters_per_unit / METERS_PER_DEGREE
+    lng_scale = lat_scale / np.cos(np.radians(origin_lat))
+    return np.array([
+        [lng_scale * cos, -lng_scale * sin, origin_lng],
+        [lat_scale * sin, lat_scale * cos, origin_lat]
+    ])
+
+
+def affine_from_control_points(local_points, world_points):
+    """
+    Least-squares 2x3 affine matrix mapping local_points onto world_points.
+
+    Needs at least three non-collinear pairs, e.g. store corners with
+    known (lng, lat).
+    """
+    local_points = np.asarray(local_points, dtype=np.float64)
+    world_points = np.asarray(world_points, dtype=np.float64)
+    design = np.column_stack([local_points, np.ones(len(local_points))])
+    solution, *_ = np.linalg.lstsq(design, world_points, rcond=None)
+    return solution.T
+
+
+def main():
+    """Print a geometry summary for a saved store map."""
+    parser = argparse.ArgumentParser(description="Summarize store map geometry")
+    parser.add_argument("map_file", help="Saved map (store_<id>_*.json)")
+
+    args = parser.parse_args()
+
+    with open(args.map_file, 'r') as f:
+        geometry = GeometryBuffer.from_map_data(json.load(f))
+
+    if not len(geometry):
+        console.print("[yellow]⚠ No floor/section/aisle outlines found in map[/yellow]\n")
+        return 1
+
+    areas = geometry.areas()
+    bounds = geometry.bounds()
+
+    table = Table(title="Map Geometry", box=box.ROUNDED)
+    table.add_column("Kind", style="cyan")
+    table.add_column("Features", style="magenta")
+    table.add_column("Total Area", style="green")
+    table.add_column("Extent", style="yellow")
+
+    for _, kind in FEATURE_KINDS:
+        mask = geometry.feature_kinds == kind
+        if not mask.any():
+            continue
+        minx, miny = bounds[mask, :2].min(axis=0)
+        maxx, maxy = bounds[mask, 2:].max(axis=0)
+        table.add_row(kind, str(mask.sum()), f"{areas[mask].sum():.1f}", f"{maxx - minx:.1f} x {maxy - miny:.1f}")
+
+    console.print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
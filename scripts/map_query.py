@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Query every downloaded store map at once.
+
+Answering "which stores have a Starbucks section on floor 2" used to mean
+opening every store_<id>_latest.json. This script keeps a SQLite index
+over the latest map of each store:
+
+- stores:       one row per store (config attributes + map stats)
+- features:     every floor, section and aisle with its floor and department
+- features_fts: FTS5 full-text index over feature names and departments
+
+The index refreshes incrementally: only maps whose size or mtime changed
+are re-read, and save_map updates its store's rows directly after
+writing a new version.
+
+Usage:
+    python map_query.py refresh
+    python map_query.py search starbucks --floor 2
+    python map_query.py search "pharmacy" --kind section --stores-only
+    python map_query.py stats
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+console = Console()
+
+DEFAULT_DB = Path("data/index/maps.db")
+MAPS_DIR = Path("data/maps")
+STORES_FILE = Path("config/target_stores.json")
+
+FEATURE_KINDS = [("floors", "floor"), ("sections", "section"), ("aisles", "aisle")]
+NAME_KEYS = ["name", "title", "label", "display_name"]
+DEPARTMENT_KEYS = ["department", "category", "department_name"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stores (
+    store_id TEXT PRIMARY KEY,
+    name TEXT,
+    address TEXT,
+    latitude REAL,
+    longitude REAL,
+    map_file TEXT,
+    map_size INTEGER,
+    map_mtime REAL,
+    floors INTEGER NOT NULL DEFAULT 0,
+    sections INTEGER NOT NULL DEFAULT 0,
+    aisles INTEGER NOT NULL DEFAULT 0,
+    downloaded_at TEXT,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS features (
+    id INTEGER PRIMARY KEY,
+    store_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    feature_id TEXT,
+    name TEXT,
+    department TEXT,
+    floor TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_features_store ON features (store_id);
+CREATE INDEX IF NOT EXISTS idx_features_kind_floor ON features (kind, floor);
+CREATE VIRTUAL TABLE IF NOT EXISTS features_fts USING fts5(
+    name, department, content='features', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS features_ai AFTER INSERT ON features BEGIN
+    INSERT INTO features_fts (rowid, name, department) VALUES (new.id, new.name, new.department);
+END;
+CREATE TRIGGER IF NOT EXISTS features_ad AFTER DELETE ON features BEGIN
+    INSERT INTO features_fts (features_fts, rowid, name, department)
+    VALUES ('delete', old.id, old.name, old.department);
+END;
+"""
+
+
+def _first(mapping, keys):
+    for key in keys:
+        if mapping.get(key) not in (None, ""):
+            return str(mapping[key])
+    return None
+
+
+def map_features(map_data):
+    """Yield (kind, feature_id, name, department, floor) for every named feature."""
+    metadata = map_data.get("metadata") or {}
+    for key, kind in FEATURE_KINDS:
+        for feature in metadata.get(key) or []:
+            if not isinstance(feature, dict):
+                continue
+            name = _first(feature, NAME_KEYS)
+            department = _first(feature, DEPARTMENT_KEYS)
+            if name is None and department is None:
+                continue
+            if kind == "floor":
+                floor = _first(feature, ["floor", "level", "number", "id"])
+            else:
+                floor = _first(feature, ["floor", "floor_id", "level"])
+            yield kind, _first(feature, ["id"]), name, department, floor
+
+
+def fts_phrase(text):
+    """Quote user text as an FTS5 phrase so punctuation can't break the query."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class MapIndex:
+    """SQLite index over the latest saved map of every store."""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def load_store_attributes(self, stores_file=STORES_FILE):
+        """Fill store name/address/coordinates from target_stores.json."""
+        if not Path(stores_file).exists():
+            return
+        with open(stores_file, 'r') as f:
+            stores = json.load(f).get("stores", [])
+
+        with self.conn:
+            for store in stores:
+                coordinates = store.get("coordinates", {})
+                self.conn.execute(
+                    """
+                    INSERT INTO stores (store_id, name, address, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (store_id) DO UPDATE SET
+                        name = excluded.name,
+                        address = excluded.address,
+                        latitude = excluded.latitude,
+                        longitude = excluded.longitude
+                    """,
+                    (store["id"], store.get("name"), store.get("address"),
+                     coordinates.get("latitude"), coordinates.get("longitude"))
+                )
+
+    def index_map(self, store_id, map_file, map_data=None):
+        """(Re)index one store's map, replacing its previous features."""
+        map_file = Path(map_file)
+        stat = map_file.stat()
+        if map_data is None:
+            with open(map_file, 'r') as f:
+                map_data = json.load(f)
+
+        features = list(map_features(map_data))
+        counts = {kind: 0 for _, kind in FEATURE_KINDS}
+        for _, kind in FEATURE_KINDS:
+            counts[kind] = len((map_data.get("metadata") or {}).get(f"{kind}s") or [])
+
+        with self.conn:
+            self.conn.execute("DELETE FROM features WHERE store_id = ?", (store_id,))
+            self.conn.executemany(
+                "INSERT INTO features (store_id, kind, feature_id, name, department, floor) VALUES (?, ?, ?, ?, ?, ?)",
+                ((store_id,) + feature for feature in features)
+            )
+            self.conn.execute(
+                """
+                INSERT INTO stores (store_id, map_file, map_size, map_mtime, floors, sections, aisles, downloaded_at, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (store_id) DO UPDATE SET
+                    map_file = excluded.map_file,
+                    map_size = excluded.map_size,
+                    map_mtime = excluded.map_mtime,
+                    floors = excluded.floors,
+                    sections = excluded.sections,
+                    aisles = excluded.aisles,
+                    downloaded_at = excluded.downloaded_at,
+                    indexed_at = excluded.indexed_at
+                """,
+                (store_id, str(map_file), stat.st_size, stat.st_mtime, counts["floor"], counts["section"],
+                 counts["aisle"], map_data.get("downloaded_at"), time.time())
+            )
+        return len(features)
+
+    def refresh(self, maps_dir=MAPS_DIR):
+        """
+        Index every store_<id>_latest.json whose size or mtime changed, and
+        drop stores whose map is gone.
+
+        Returns (reindexed store IDs, removed store IDs).
+        """
+        known = {
+            store_id: (size, mtime)
+            for store_id, size, mtime in self.conn.execute(
+                "SELECT store_id, map_size, map_mtime FROM stores WHERE map_file IS NOT NULL"
+            )
+        }
+
+        reindexed = []
+        seen = set()
+        for path in Path(maps_dir).glob("store_*_latest.json"):
+            store_id = path.name[len("store_"):-len("_latest.json")]
+            seen.add(store_id)
+            stat = path.stat()
+            if known.get(store_id) == (stat.st_size, stat.st_mtime):
+                continue
+            self.index_map(store_id, path)
+            reindexed.append(store_id)
+
+        removed = sorted(set(known) - seen)
+        with self.conn:
+            for store_id in removed:
+                self.conn.execute("DELETE FROM features WHERE store_id = ?", (store_id,))
+                self.conn.execute(
+                    "UPDATE stores SET map_file = NULL, map_size = NULL, map_mtime = NULL, "
+                    "floors = 0, sections = 0, aisles = 0 WHERE store_id = ?",
+                    (store_id,)
+                )
+        return reindexed, removed
+
+    def search(self, text, kind=None, floor=None, store_ids=None, limit=1000):
+        """
+        Full-text search over feature names and departments.
+
+        Returns a list of dicts with store and feature details, best
+        matches first.
+        """
+        sql = [
+            "SELECT f.store_id, s.name, f.kind, f.name, f.department, f.floor",
+            "FROM features_fts",
+            "JOIN features f ON f.id = features_fts.rowid",
+            "LEFT JOIN stores s ON s.store_id = f.store_id",
+            "WHERE features_fts MATCH ?"
+        ]
+        params = [fts_phrase(text)]
+        if kind:
+            sql.append("AND f.kind = ?")
+            params.append(kind)
+        if floor is not None:
+            sql.append("AND f.floor = ?")
+            params.append(str(floor))
+        if store_ids:
+            sql.append(f"AND f.store_id IN ({','.join('?' * len(store_ids))})")
+            params.extend(store_ids)
+        sql.append("ORDER BY bm25(features_fts) LIMIT ?")
+        params.append(limit)
+
+        columns = ("store_id", "store_name", "kind", "name", "department", "floor")
+        return [dict(zip(columns, row)) for row in self.conn.execute(" ".join(sql), params)]
+
+    def stores_with(self, text, kind=None, floor=None, store_ids=None):
+        """Return sorted store IDs having at least one matching feature."""
+        return sorted({match["store_id"] for match in self.search(text, kind, floor, store_ids, limit=-1)})
+
+    def stats(self):
+        stores, indexed = self.conn.execute(
+            "SELECT COUNT(*), COUNT(map_file) FROM stores"
+        ).fetchone()
+        features = self.conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+        return {"stores": stores, "stores_with_maps": indexed, "features": features}
+
+
+def update_map_index(store_id, map_file, map_data=None, db_path=DEFAULT_DB):
+    """Index one freshly saved map; used by save_map after each download."""
+    index = MapIndex(db_path)
+    try:
+        return index.index_map(store_id, map_file, map_data)
+    finally:
+        index.close()
+
+
+def main():
+    """Refresh or query the fleet map index."""
+    parser = argparse.ArgumentParser(description="Query downloaded Target store maps")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="Index database path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    refresh = subparsers.add_parser("refresh", help="Index new or changed maps")
+    refresh.add_argument("--maps-dir", default=str(MAPS_DIR))
+    refresh.add_argument("--stores-file", default=str(STORES_FILE))
+
+    search = subparsers.add_parser("search", help="Find sections/aisles/departments by name")
+    search.add_argument("text", help="Name to search for, e.g. starbucks")
+    search.add_argument("--kind", choices=["floor", "section", "aisle"])
+    search.add_argument("--floor", help="Only features on this floor")
+    search.add_argument("--store", action="append", help="Limit to these store IDs")
+    search.add_argument("--stores-only", action="store_true", help="List matching stores only")
+    search.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    subparsers.add_parser("stats", help="Show index size")
+
+    args = parser.parse_args()
+    index = MapIndex(args.db)
+
+    try:
+        if args.command == "refresh":
+            index.load_store_attributes(args.stores_file)
+            reindexed, removed = index.refresh(args.maps_dir)
+            console.print(f"[green]✓ Reindexed {len(reindexed)} stores, removed {len(removed)}[/green]")
+            console.print(f"[cyan]Index: {index.stats()}[/cyan]\n")
+            return 0
+
+        if args.command == "stats":
+            console.print(index.stats())
+            return 0
+
+        start = time.perf_counter()
+        if args.stores_only:
+            results = index.stores_with(args.text, args.kind, args.floor, args.store)
+        else:
+            results = index.search(args.text, args.kind, args.floor, args.store)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if args.json:
+            print(json.dumps(results, indent=2))
+        elif args.stores_only:
+            for store_id in results:
+                console.print(store_id)
+        else:
+            table = Table(title=f"Matches for '{args.text}'", box=box.ROUNDED)
+            table.add_column("Store", style="cyan")
+            table.add_column("Name", style="white")
+            table.add_column("Kind", style="magenta")
+            table.add_column("Feature", style="green")
+            table.add_column("Department", style="yellow")
+            table.add_column("Floor", style="yellow")
+            for match in results:
+                table.add_row(
+                    match["store_id"], match["store_name"] or "", match["kind"],
+                    match["name"] or "", match["department"] or "", match["floor"] or ""
+                )
+            console.print(table)
+
+        if not args.json:
+            console.print(f"\n[dim]{len(results)} results in {elapsed_ms:.1f} ms[/dim]\n")
+    finally:
+        index.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
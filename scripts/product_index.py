@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Persistent (store, product) -> aisle/section index.
+
+Product location responses (the Product Location API in
+docs/API_FINDINGS.md) are scattered across captures, analysis files and
+downloaded maps. This script extracts every product position it can find
+and keeps them in a SQLite table keyed by (store_id, tcin), so lookups are
+B-tree searches instead of re-scanning raw capture JSON.
+
+Ingestion is incremental: each source file is recorded with its size and
+mtime and skipped on later runs unless it changed. When the same product
+is seen more than once, the most recent observation wins.
+
+Usage:
+    python product_index.py build data/captured/*.har data/analyzed/*.json
+    python product_index.py lookup --store T-1234 12345678 87654321
+    python product_index.py where 12345678
+    python product_index.py stats
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlparse
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+from analyze_traffic import TrafficAnalyzer, response_text
+
+console = Console()
+
+DEFAULT_DB = Path("data/index/product_locations.db")
+
+PRODUCT_KEYS = ["tcin", "product_id", "productId", "item_id", "itemId"]
+STORE_KEYS = ["store_id", "storeId", "location_id", "locationId", "pricing_store_id"]
+POSITION_KEYS = ["store_positions", "storePositions", "aisle_locations", "locations", "location", "position"]
+AISLE_KEYS = ["aisle", "aisle_id", "aisleId", "aisle_name"]
+SECTION_KEYS = ["section", "block", "section_id", "sectionId"]
+FLOOR_KEYS = ["floor", "floor_id", "level"]
+
+# SQLite's default limit on bound parameters is 999
+LOOKUP_BATCH = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS product_locations (
+    store_id TEXT NOT NULL,
+    tcin TEXT NOT NULL,
+    aisle TEXT,
+    section TEXT,
+    floor TEXT,
+    observed_at REAL NOT NULL,
+    source TEXT,
+    PRIMARY KEY (store_id, tcin)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_product_locations_tcin ON product_locations (tcin, store_id);
+CREATE TABLE IF NOT EXISTS ingested_sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    rows INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO product_locations (store_id, tcin, aisle, section, floor, observed_at, source)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (store_id, tcin) DO UPDATE SET
+    aisle = excluded.aisle,
+    section = excluded.section,
+    floor = excluded.floor,
+    observed_at = excluded.observed_at,
+    source = excluded.source
+WHERE excluded.observed_at >= product_locations.observed_at
+"""
+
+
+def _first(mapping, keys):
+    for key in keys:
+        value = mapping.get(key)
+        if value not in (None, "", [], {}):
+            return value
+    return None
+
+
+def _as_text(value):
+    return None if value is None else str(value)
+
+
+def store_id_from_url(url):
+    """Return the store ID in a request URL's query or /stores/<id> path, if any."""
+    parsed = urlparse(url)
+    for name, value in parse_qsl(parsed.query):
+        if name in STORE_KEYS or name == "store":
+            return value
+    match = re.search(r"/(?:stores|locations)/([^/]+)", parsed.path)
+    return match.group(1) if match else None
+
+
+def _position(item):
+    """Return (aisle, section, floor) for a product dict, or None."""
+    candidates = [item]
+    for key in POSITION_KEYS:
+        nested = item.get(key)
+        if isinstance(nested, list) and nested and isinstance(nested[0], dict):
+            candidates.insert(0, nested[0])
+        elif isinstance(nested, dict):
+            candidates.insert(0, nested)
+
+    for candidate in candidates:
+        aisle = _first(candidate, AISLE_KEYS)
+        section = _first(candidate, SECTION_KEYS)
+        if aisle is not None or section is not None:
+            floor = _first(candidate, FLOOR_KEYS)
+            return _as_text(aisle), _as_text(section), _as_text(floor)
+    return None
+
+
+def extract_locations(document, store_id=None):
+    """
+    Yield (store_id, tcin, aisle, section, floor) for every product
+    position in a parsed JSON document.
+
+    Store IDs and TCINs found on an enclosing object apply to everything
+    below it, so positions nested under a product's per-store fulfillment
+    options are attributed to that product and store.
+    """
+    stack = [(document, store_id, None)]
+    while stack:
+        node, current_store, current_tcin = stack.pop()
+        if isinstance(node, list):
+            stack.extend((item, current_store, current_tcin) for item in node)
+            continue
+        if not isinstance(node, dict):
+            continue
+
+        current_store = _as_text(_first(node, STORE_KEYS)) or current_store
+        tcin = _first(node, PRODUCT_KEYS)
+        current_tcin = _as_text(tcin) if tcin is not None else current_tcin
+
+        position = _position(node) if current_tcin is not None and current_store is not None else None
+        if position is not None:
+            yield (current_store, current_tcin) + position
+            continue
+
+        stack.extend(
+            (value, current_store, current_tcin)
+            for value in node.values() if isinstance(value, (dict, list))
+        )
+
+
+def _response_json(response_content, base_dir):
+    text = response_text(response_content, base_dir)
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def locations_from_file(path):
+    """Yield product locations from a capture, analysis file or saved map."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    if not isinstance(data, dict):
+        return
+    if "interesting_endpoints" in data:
+        requests = data["interesting_endpoints"]
+    elif "requests" in data or "log" in data:
+        analyzer = TrafficAnalyzer(path)
+        analyzer.requests = analyzer._parse_har(data) if "log" in data else data["requests"]
+        requests = analyzer.requests
+    else:
+        # A saved map: everything in it, including its asset bodies on
+        # disk, belongs to one store
+        store_id = _as_text(data.get("store_id"))
+        yield from extract_locations(data, store_id)
+        map_body = data.get("map") if isinstance(data.get("map"), dict) else {}
+        for asset in (map_body.get("layout") or []) + (map_body.get("assets") or []):
+            if "json" in asset.get("content_type", ""):
+                document = _response_json(asset, Path(path).parent)
+                if document is not None:
+                    yield from extract_locations(document, store_id)
+        return
+
+    for req in requests:
+        document = _response_json(req.get("response_content"), Path(path).parent)
+        if document is not None:
+            yield from extract_locations(document, store_id_from_url(req.get("url", "")))
+
+
+class ProductLocationIndex:
+    """SQLite-backed (store_id, tcin) -> aisle/section lookup."""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def upsert_many(self, rows, observed_at=None, source=None):
+        """
+        Insert or update (store_id, tcin, aisle, section, floor) rows.
+
+        Older observations never overwrite newer ones.
+        """
+        observed_at = observed_at or time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                UPSERT,
+                ((store, tcin, aisle, section, floor, observed_at, source)
+                 for store, tcin, aisle, section, floor in rows)
+            )
+        return cursor.rowcount
+
+    def ingest_file(self, path, force=False):
+        """
+        Index one source file, skipping it if unchanged since last time.
+
+        Returns the number of rows written, or None if the file was skipped.
+        """
+        path = Path(path)
+        stat = path.stat()
+        key = str(path.resolve())
+
+        if not force:
+            row = self.conn.execute(
+                "SELECT size, mtime FROM ingested_sources WHERE path = ?", (key,)
+            ).fetchone()
+            if row == (stat.st_size, stat.st_mtime):
+                return None
+
+        written = self.upsert_many(locations_from_file(path), observed_at=stat.st_mtime, source=path.name)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ingested_sources VALUES (?, ?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime, written, time.time())
+            )
+        return written
+
+    def lookup(self, store_id, tcin):
+        """Return {aisle, section, floor, observed_at} for one product, or None."""
+        row = self.conn.execute(
+            "SELECT aisle, section, floor, observed_at FROM product_locations WHERE store_id = ? AND tcin = ?",
+            (str(store_id), str(tcin))
+        ).fetchone()
+        return dict(zip(("aisle", "section", "floor", "observed_at"), row)) if row else None
+
+    def lookup_many(self, store_id, tcins):
+        """Return {tcin: location} for every product found in one store."""
+        tcins = [str(t) for t in tcins]
+        results = {}
+        for start in range(0, len(tcins), LOOKUP_BATCH):
+            batch = tcins[start:start + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT tcin, aisle, section, floor, observed_at FROM product_locations "
+                f"WHERE store_id = ? AND tcin IN ({placeholders})",
+                [str(store_id)] + batch
+            )
+            for tcin, *location in rows:
+                results[tcin] = dict(zip(("aisle", "section", "floor", "observed_at"), location))
+        return results
+
+    def stores_for(self, tcin):
+        """Return {store_id: location} for every store a product was seen in."""
+        rows = self.conn.execute(
+            "SELECT store_id, aisle, section, floor, observed_at FROM product_locations WHERE tcin = ?",
+            (str(tcin),)
+        )
+        return {
+            store_id: dict(zip(("aisle", "section", "floor", "observed_at"), location))
+            for store_id, *location in rows
+        }
+
+    def stats(self):
+        products, stores = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT store_id) FROM product_locations"
+        ).fetchone()
+        sources = self.conn.execute("SELECT COUNT(*) FROM ingested_sources").fetchone()[0]
+        return {"locations": products, "stores": stores, "sources": sources}
+
+
+def _print_locations(title, key_name, results):
+    if not results:
+        console.print("[yellow]⚠ No locations found[/yellow]\n")
+        return
+
+    table = Table(title=title, box=box.ROUNDED)
+    table.add_column(key_name, style="cyan")
+    table.add_column("Aisle", style="magenta")
+    table.add_column("Section", style="green")
+    table.add_column("Floor", style="yellow")
+    for key, location in sorted(results.items()):
+        table.add_row(key, location["aisle"] or "", location["section"] or "", location["floor"] or "")
+    console.print(table)
+
+
+def main():
+    """Build or query the product location index."""
+    parser = argparse.ArgumentParser(description="Product to aisle/section lookup index")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="Index database path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index captures, analysis files or saved maps")
+    build.add_argument("files", nargs="+", help="JSON/HAR files to ingest")
+    build.add_argument("--force", action="store_true", help="Re-ingest unchanged files")
+
+    lookup = subparsers.add_parser("lookup", help="Look up products in one store")
+    lookup.add_argument("--store", required=True, help="Store ID")
+    lookup.add_argument("tcins", nargs="+", help="Product TCINs")
+
+    where = subparsers.add_parser("where", help="List every store a product was seen in")
+    where.add_argument("tcin", help="Product TCIN")
+
+    subparsers.add_parser("stats", help="Show index size")
+
+    args = parser.parse_args()
+    index = ProductLocationIndex(args.db)
+
+    failed = 0
+    try:
+        if args.command == "build":
+            for path in args.files:
+                # One truncated or unreadable capture shouldn't abort the build
+                try:
+                    written = index.ingest_file(path, force=args.force)
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    console.print(f"[red]✗ {path}: invalid JSON: {e}[/red]")
+                    failed += 1
+                    continue
+                except OSError as e:
+                    console.print(f"[red]✗ {path}: {e}[/red]")
+                    failed += 1
+                    continue
+                if written is None:
+                    console.print(f"[dim]• {path} unchanged, skipped[/dim]")
+                else:
+                    console.print(f"[green]✓ {path}: {written} locations[/green]")
+            console.print(f"\n[cyan]Index: {index.stats()}[/cyan]\n")
+        elif args.command == "lookup":
+            _print_locations(f"Store {args.store}", "TCIN", index.lookup_many(args.store, args.tcins))
+        elif args.command == "where":
+            _print_locations(f"TCIN {args.tcin}", "Store", index.stores_for(args.tcin))
+        else:
+            console.print(index.stats())
+    finally:
+        index.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Adaptive rate limiter shared by concurrent download workers.
+
+Concurrency is controlled with AIMD (additive increase, multiplicative
+decrease), the same scheme TCP uses for congestion control:
+
+- Every successful, fast response raises the concurrency limit by
+  roughly one request per round of in-flight requests.
+- A 429/503, a connection error, or latency well above the best observed
+  latency cuts the limit by `decrease_factor`.
+- A `Retry-After` header pauses all workers until it elapses.
+
+The crawl therefore climbs until the server pushes back, then hovers just
+below that point without manual tuning.
+
+Usage:
+    limiter = AdaptiveRateLimiter(max_limit=64)
+    limiter.acquire()
+    start = time.monotonic()
+    response = session.get(url)
+    limiter.release(response.status_code, time.monotonic() - start,
+                    response.headers.get("Retry-After"))
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Statuses that mean "slow down"
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value, now=None):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds to wait."""
+    if not value:
+        return None
+
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    """AIMD concurrency limiter driven by latency and throttling responses."""
+
+    def __init__(
+        self,
+        initial_limit=4,
+        min_limit=1,
+        max_limit=64,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+        rate_window=10.0,
+        clock=time.monotonic
+    ):
+        """
+        Args:
+            initial_limit: Concurrent requests allowed at start.
+            min_limit / max_limit: Bounds for the concurrency limit.
+            decrease_factor: Multiplier applied to the limit on backoff.
+            latency_tolerance: Back off when smoothed latency exceeds the
+                best observed latency by this factor.
+            rate_window: Seconds of history used for `current_rate`.
+            clock: Monotonic time source, overridable for tests.
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.rate_window = rate_window
+        self.clock = clock
+
+        self.in_flight = 0
+        self.throttled = 0
+        self.min_latency = None
+        self.latency_ewma = None
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._completions = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a request slot is free and no Retry-After pause is active."""
+        with self._cond:
+            while True:
+                wait = self._blocked_until - self.clock()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, status, latency, retry_after=None):
+        """
+        Return a slot and feed the response back into the limiter.
+
+        Args:
+            status: HTTP status code, or None if the request failed outright.
+            latency: Seconds the request took.
+            retry_after: Raw Retry-After header value, if any.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = self.clock()
+            self._completions.append(now)
+            self._trim_completions(now)
+
+            wait = parse_retry_after(retry_after)
+            if wait:
+                self._blocked_until = max(self._blocked_until, now + wait)
+
+            if status is None or status in THROTTLE_STATUSES:
+                self.throttled += 1
+                self._decrease(now)
+            elif self._observe_latency(latency):
+                self._decrease(now)
+            else:
+                # +1 per full window of in-flight requests
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        """Update latency stats; return True if latency signals congestion."""
+        # The baseline drifts up slowly so one unusually fast response
+        # (e.g. a cache hit) can't pin it forever
+        if self.min_latency is None:
+            self.min_latency = latency
+        else:
+            self.min_latency = min(latency, self.min_latency * 1.01)
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        return self.latency_ewma > self.min_latency * self.latency_tolerance
+
+    def _decrease(self, now):
+        # Requests already in flight when the server pushed back will report
+        # the same congestion; only cut once per smoothed round trip.
+        cooldown = self.latency_ewma or 0.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+    @property
+    def current_rate(self):
+        """Completed requests per second over the last `rate_window` seconds."""
+        with self._cond:
+            self._trim_completions(self.clock())
+            return len(self._completions) / self.rate_window
+
+    def _trim_completions(self, now):
+        cutoff = now - self.rate_window
+        while self._completions and self._completions[0] < cutoff:
+            self._completions.popleft()
+
+    def snapshot(self):
+        """Return the limiter's current metrics as a dict."""
+        rate = self.current_rate
+        with self._cond:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "requests_per_second": round(rate, 2),
+                "throttled": self.throttled,
+                "latency_ewma": self.latency_ewma,
+                "paused_for": max(0.0, self._blocked_until - self.clock())
+            }
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Offline replay server for captured Target API traffic.
+
+Serves the responses recorded in an analysis file (interesting_endpoints
+with response_content) from a local asyncio HTTP server, so
+StoreMapDownloader's concurrency, pooling and retry behaviour can be
+benchmarked reproducibly without touching the real API.
+
+Requests are matched by method and endpoint template (ID-like path
+segments collapsed to {id}), so a capture of one store answers requests
+for any store. An exact path + query match is preferred when recorded.
+
+Fault injection:
+- --latency / --jitter: delay every response
+- --error-rate: fraction of requests answered with a 500
+- --rate-limit / --burst: token bucket; excess requests get 429 + Retry-After
+- --max-concurrency: requests beyond this many in flight get 503
+
+GET /__replay/stats returns request counts by status as JSON.
+
+Usage:
+    python replay_server.py data/analyzed/analysis_session.json --port 8900
+    python replay_server.py analysis.json --latency 0.05 --rate-limit 500 --error-rate 0.01
+    python download_store_map.py --all-stores --base-url http://127.0.0.1:8900
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import cycle
+from pathlib import Path
+from urllib.parse import urlparse
+from rich.console import Console
+
+from analyze_traffic import endpoint_template, response_text
+
+console = Console()
+
+STATUS_TEXT = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+STATS_PATH = "/__replay/stats"
+
+
+class RecordedResponse:
+    """A response body, status and content type taken from a capture."""
+
+    def __init__(self, status, body, content_type):
+        self.status = status or 200
+        self.body = body
+        self.content_type = content_type or "application/json"
+
+    @classmethod
+    def from_endpoint(cls, endpoint, base_dir="."):
+        content = endpoint.get("response_content") or {}
+        text = response_text(content, base_dir) or ""
+        if content.get("encoding") == "base64":
+            body = base64.b64decode(text)
+        else:
+            body = text.encode("utf-8")
+        return cls(endpoint.get("status"), body, content.get("mimeType"))
+
+
+def load_routes(analysis, base_dir="."):
+    """
+    Build route tables from an analysis dict: every interesting endpoint,
+    plus the captured auth endpoint answering with its recorded token.
+
+    base_dir is the analysis file's directory, used to resolve response
+    bodies the analyzer moved to side files.
+
+    Returns (exact, templates): exact maps (method, path?query) to a
+    response; templates maps (method, template) to a cycle over every
+    response recorded for that template.
+    """
+    exact = {}
+    by_template = defaultdict(list)
+    routes = [(endpoint, RecordedResponse.from_endpoint(endpoint, base_dir))
+              for endpoint in analysis.get("interesting_endpoints", [])]
+
+    # Answer token refreshes too, so an offline run never reaches the real auth server
+    auth = analysis.get("auth_endpoint") or {}
+    if auth.get("token"):
+        body = {auth.get("token_field", "access_token"): auth["token"], "expires_in": auth.get("expires_in")}
+        routes.append((auth, RecordedResponse(200, json.dumps(body).encode("utf-8"), "application/json")))
+
+    for endpoint, response in routes:
+        parsed = urlparse(endpoint["url"])
+        method = endpoint["method"].upper()
+        target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        exact.setdefault((method, target), response)
+        by_template[(method, endpoint_template(parsed.path))].append(response)
+
+    return exact, {key: cycle(responses) for key, responses in by_template.items()}
+
+
+class TokenBucket:
+    """Token bucket used to simulate server-side rate limiting."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self):
+        """Take a token; returns 0 on success or seconds until one is available."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class ReplayServer:
+    """Asyncio HTTP/1.1 server answering with recorded responses."""
+
+    def __init__(
+        self,
+        analysis,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        rate_limit=None,
+        burst=None,
+        max_concurrency=None,
+        seed=None,
+        base_dir="."
+    ):
+        self.exact, self.templates = load_routes(analysis, base_dir)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_concurrency = max_concurrency
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.stats = Counter()
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._connections = {}  # handler task -> writer
+
+    def _route(self, method, target):
+        response = self.exact.get((method, target))
+        if response is not None:
+            return response
+        responses = self.templates.get((method, endpoint_template(target.split("?", 1)[0])))
+        return next(responses) if responses else None
+
+    async def _respond(self, method, target):
+        """Return (status, body, content_type, extra headers) for a request."""
+        if target == STATS_PATH:
+            body = json.dumps({"in_flight": self.in_flight, "by_status": dict(self.stats)}).encode()
+            return 200, body, "application/json", {}
+
+        if self.max_concurrency is not None and self.in_flight > self.max_concurrency:
+            return 503, b'{"error":"overloaded"}', "application/json", {"Retry-After": "1"}
+
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait:
+                retry_after = str(max(1, round(wait)))
+                return 429, b'{"error":"rate limited"}', "application/json", {"Retry-After": retry_after}
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 500, b'{"error":"injected failure"}', "application/json", {}
+
+        response = self._route(method, target)
+        if response is None:
+            return 404, b'{"error":"no recorded response"}', "application/json", {}
+        return response.status, response.body, response.content_type, {}
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                self.in_flight += 1
+                try:
+                    status, body, content_type, extra = await self._respond(method.upper(), target)
+                finally:
+                    self.in_flight -= 1
+                if target != STATS_PATH:
+                    self.stats[status] += 1
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                head = [
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Unknown')}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                ] + [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8900):
+        """Start listening; returns the bound port."""
+        self._server = await asyncio.start_server(self._handle, host, port, backlog=1024)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host="127.0.0.1", port=8900):
+        await self.start(host, port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        """
+        Run the server on a background event loop, e.g. inside a benchmark.
+
+        Returns the server's base URL; call stop() when done.
+        """
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        bound = {}
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            bound["port"] = self._loop.run_until_complete(self.start(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return f"http://{host}:{bound['port']}"
+
+    def stop(self):
+        """Stop a server started with start_in_thread()."""
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            # Idle keep-alive connections would otherwise outlive the loop;
+            # closing them ends each handler's read loop
+            connections = list(self._connections.items())
+            for _, writer in connections:
+                writer.close()
+            await asyncio.gather(*(task for task, _ in connections), return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+def main():
+    """Run the replay server."""
+    parser = argparse.ArgumentParser(description="Replay captured Target API responses")
+    parser.add_argument("analysis_file", help="Analysis JSON from analyze_traffic.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit", type=float, help="Requests per second before 429s")
+    parser.add_argument("--burst", type=float, help="Token bucket size (default: one second of --rate-limit)")
+    parser.add_argument("--max-concurrency", type=int, help="In-flight requests before 503s")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+
+    args = parser.parse_args()
+
+    with open(args.analysis_file, 'r') as f:
+        analysis = json.load(f)
+
+    server = ReplayServer(
+        analysis,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        burst=args.burst,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+        base_dir=Path(args.analysis_file).parent
+    )
+
+    console.print("\n[bold cyan]Target API Replay Server[/bold cyan]\n")
+    console.print(f"[green]✓ {len(server.templates)} endpoint templates loaded[/green]")
+    console.print(f"Listening on http://{args.host}:{args.port} (stats at {STATS_PATH})")
+    console.print("\n[dim]Press Ctrl+C to stop[/dim]\n")
+
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        console.print(f"\n[cyan]Requests by status: {dict(server.stats)}[/cyan]\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
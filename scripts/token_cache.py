@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Thread-safe auth token cache shared by concurrent download workers.
+
+Tokens are stored per scope (normally the API domain). When a token is
+missing or about to expire, exactly one worker calls the refresher while
+the others wait for its result (single-flight), so a token expiring
+mid-crawl produces one auth request instead of one per worker.
+
+Usage:
+    cache = TokenCache(refresher=my_refresh_func)
+    cache.put("api.target.com", "eyJ...", expires_at=1735689600)
+    token = cache.get("api.target.com")
+"""
+
+import base64
+import json
+import threading
+import time
+
+
+class TokenRefreshError(Exception):
+    """Raised when a token is needed but cannot be refreshed."""
+
+
+def jwt_expiry(token):
+    """Return the `exp` claim of a JWT as a Unix timestamp, or None."""
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+
+    payload = parts[1] + "=" * (-len(parts[1]) % 4)
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+
+    exp = claims.get("exp") if isinstance(claims, dict) else None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+class TokenCache:
+    """Per-scope token store with single-flight refresh."""
+
+    def __init__(self, refresher=None, expiry_skew=30, clock=time.time):
+        """
+        Args:
+            refresher: Callable taking a scope and returning
+                (token, expires_at). expires_at may be None for tokens
+                without a known lifetime.
+            expiry_skew: Seconds before expiry at which a token is treated
+                as expired, so requests don't race the real deadline.
+            clock: Time source, overridable for tests.
+        """
+        self.refresher = refresher
+        self.expiry_skew = expiry_skew
+        self.clock = clock
+        self.refresh_count = 0
+        self._tokens = {}  # scope -> (token, expires_at)
+        self._lock = threading.Lock()
+        self._refresh_locks = {}
+
+    def put(self, scope, token, expires_at=None):
+        """Store a token, e.g. one extracted from a captured session."""
+        with self._lock:
+            self._tokens[scope] = (token, expires_at)
+
+    def peek(self, scope):
+        """Return (token, expires_at) without refreshing, or None."""
+        with self._lock:
+            return self._tokens.get(scope)
+
+    def _is_fresh(self, entry):
+        if entry is None:
+            return False
+        _, expires_at = entry
+        return expires_at is None or self.clock() < expires_at - self.expiry_skew
+
+    def _refresh_lock(self, scope):
+        with self._lock:
+            return self._refresh_locks.setdefault(scope, threading.Lock())
+
+    def get(self, scope):
+        """
+        Return a valid token for scope, refreshing it if needed.
+
+        Returns None when no token is cached and no refresher is set, so
+        unauthenticated endpoints keep working.
+        """
+        entry = self.peek(scope)
+        if self._is_fresh(entry):
+            return entry[0]
+
+        if self.refresher is None:
+            if entry is None:
+                return None
+            raise TokenRefreshError(f"Token for {scope} expired and no refresher is configured")
+
+        # Only one worker refreshes; the rest block here and then pick up
+        # the token it stored instead of issuing their own refresh.
+        with self._refresh_lock(scope):
+            entry = self.peek(scope)
+            if self._is_fresh(entry):
+                return entry[0]
+
+            try:
+                token, expires_at = self.refresher(scope)
+            except Exception as e:
+                raise TokenRefreshError(f"Token refresh for {scope} failed: {e}") from e
+
+            if expires_at is None:
+                expires_at = jwt_expiry(token)
+            self.put(scope, token, expires_at)
+            self.refresh_count += 1
+            return token
+
+    def invalidate(self, scope, token):
+        """
+        Drop a token the server rejected (e.g. a 401).
+
+        Only the given token is dropped; if another worker already replaced
+        it with a fresh one, the fresh token is kept.
+        """
+        with self._lock:
+            entry = self._tokens.get(scope)
+            if entry is not None and entry[0] == token:
+                self._tokens[scope] = (token, 0)
@@ -8,75 +8,119 @@ This script checks:
 - mitmproxy is installed and running
 - Target app is installed
 - Proxy configuration
+
+Checks run concurrently with a per-check timeout, and shared command
+output (e.g. `adb devices`) is fetched once. Every attached device is
+verified in the same pass.
+
+Usage:
+    python verify_setup.py
+    python verify_setup.py --devices emulator-5554,emulator-5556
+    python verify_setup.py --json > health.json
 """
 
+import argparse
+import json
 import subprocess
 import sys
 import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
 from rich.console import Console
 from rich.table import Table
 from rich import box
 
 console = Console()
 
+# Seconds any single check may take before it is reported as timed out
+CHECK_TIMEOUT = 10
+
+_run_cache = {}
+_run_lock = threading.Lock()
+_command_timeout = CHECK_TIMEOUT
+
+
+def run_cached(args, timeout=None):
+    """
+    Run a command once per verification pass.
+    
+    Several checks need the same output (e.g. `adb devices`); concurrent
+    callers wait for the first run and share its CompletedProcess.
+    timeout defaults to the pass's timeout (see clear_command_cache), so a
+    hung command is killed when its check times out.
+    Raises FileNotFoundError or subprocess.TimeoutExpired like subprocess.run.
+    """
+    timeout = timeout or _command_timeout
+    key = tuple(args)
+    with _run_lock:
+        future = _run_cache.get(key)
+        owner = future is None
+        if owner:
+            future = _run_cache[key] = Future()
+    
+    if owner:
+        try:
+            future.set_result(subprocess.run(args, capture_output=True, text=True, timeout=timeout))
+        except Exception as e:
+            future.set_exception(e)
+    return future.result()
+
+
+def clear_command_cache(timeout=CHECK_TIMEOUT):
+    """Forget cached command results and set the command timeout for the next pass."""
+    global _command_timeout
+    with _run_lock:
+        _run_cache.clear()
+        _command_timeout = timeout
+
+
+def _adb(serial, *args):
+    return ["adb"] + (["-s", serial] if serial else []) + list(args)
+
 
 def check_command_exists(command):
     """Check if a command exists in PATH."""
     try:
-        subprocess.run(
-            [command, "--version"],
-            capture_output=True,
-            check=True
-        )
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
+        return run_cached([command, "--version"]).returncode == 0
+    except (subprocess.TimeoutExpired, FileNotFoundError):
         return False
 
 
+def list_devices():
+    """Return serials of attached devices in the `device` (ready) state."""
+    try:
+        result = run_cached(["adb", "devices"])
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return []
+    if result.returncode != 0:
+        return []
+    
+    devices = []
+    for line in result.stdout.split('\n')[1:]:  # First line is header
+        parts = line.strip().split('\t')
+        if len(parts) == 2 and parts[1] == "device":
+            devices.append(parts[0])
+    return devices
+
+
 def check_adb_devices():
     """Check if emulator is running via adb."""
-    try:
-        result = subprocess.run(
-            ["adb", "devices"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        devices = [line for line in result.stdout.split('\n') 
-                   if 'emulator' in line or 'device' in line.split('\t')[-1]]
-        return len(devices) > 1  # First line is header
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+    return len(list_devices()) > 0
 
 
 def get_emulator_name():
     """Get the name/ID of running emulator."""
-    try:
-        result = subprocess.run(
-            ["adb", "devices"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        for line in result.stdout.split('\n'):
-            if 'emulator' in line and '\tdevice' in line:
-                return line.split('\t')[0]
-        return None
-    except:
-        return None
+    emulators = [serial for serial in list_devices() if serial.startswith("emulator")]
+    return emulators[0] if emulators else None
 
 
-def check_target_app_installed():
+def check_target_app_installed(serial=None):
     """Check if Target app is installed on emulator."""
     try:
-        result = subprocess.run(
-            ["adb", "shell", "pm", "list", "packages", "com.target"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return "com.target.ui" in result.stdout
-    except:
+        result = run_cached(_adb(serial, "shell", "pm", "list", "packages", "com.target"))
+        return result.returncode == 0 and "com.target.ui" in result.stdout
+    except (subprocess.TimeoutExpired, FileNotFoundError):
         return False
 
 
@@ -92,25 +136,27 @@ def check_port_open(host, port):
         return False
 
 
-def check_emulator_proxy():
-    """Check if emulator has proxy configured (best effort)."""
+def get_emulator_proxy(serial=None):
+    """Return the device's global http_proxy setting, or None if unknown."""
     try:
-        # This is approximate - checking if global proxy is set
-        result = subprocess.run(
-            ["adb", "shell", "settings", "get", "global", "http_proxy"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        proxy = result.stdout.strip()
-        return "10.0.2.2:8080" in proxy or proxy != "null"
-    except:
+        result = run_cached(_adb(serial, "shell", "settings", "get", "global", "http_proxy"))
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def check_emulator_proxy(serial=None, proxy_port=8080):
+    """Check if emulator has a proxy configured on proxy_port (best effort)."""
+    # This is approximate - checking the global proxy's port
+    proxy = get_emulator_proxy(serial)
+    if proxy is None:
         return None  # Unknown
+    return proxy.rsplit(":", 1)[-1] == str(proxy_port)
 
 
 def check_python_packages():
     """Check if required Python packages are installed."""
-    required = ["mitmproxy", "requests", "pandas", "rich"]
+    required = ["mitmproxy", "requests", "pandas", "rich", "ijson"]
     installed = []
     missing = []
     
@@ -124,8 +170,144 @@ def check_python_packages():
     return installed, missing
 
 
+def _result(component, status, label, details, device=None):
+    return {"component": component, "status": status, "label": label, "details": details, "device": device}
+
+
+def host_checks(proxy_port=8080, web_port=8081):
+    """Checks that run once per machine, as (name, callable) pairs."""
+    def adb():
+        if check_command_exists("adb"):
+            return _result("adb", "pass", "✓ Installed", "Android Debug Bridge ready")
+        return _result("adb", "fail", "✗ Not Found", "Install Android SDK platform-tools")
+    
+    def emulators():
+        devices = list_devices()
+        if devices:
+            return _result("Emulator", "pass", "✓ Running", f"Devices: {', '.join(devices)}")
+        return _result("Emulator", "fail", "✗ Not Running", "Start emulator with AVD Manager")
+    
+    def mitmproxy():
+        if check_command_exists("mitmproxy"):
+            return _result("mitmproxy", "pass", "✓ Installed", "Proxy tool ready")
+        return _result("mitmproxy", "fail", "✗ Not Found", "Install: brew install mitmproxy")
+    
+    def proxy_listener():
+        name = f"mitmproxy (port {proxy_port})"
+        if check_port_open("localhost", proxy_port):
+            return _result(name, "pass", "✓ Running", "Proxy listener active")
+        return _result(name, "fail", "✗ Not Running", f"Start: mitmweb --listen-port {proxy_port}")
+    
+    def web_ui():
+        name = f"mitmweb UI (port {web_port})"
+        if check_port_open("localhost", web_port):
+            return _result(name, "pass", "✓ Running", f"http://localhost:{web_port}")
+        return _result(name, "fail", "✗ Not Running", "Access UI after starting mitmweb")
+    
+    def packages():
+        installed, missing = check_python_packages()
+        if not missing:
+            return _result("Python Packages", "pass", "✓ Installed", f"{len(installed)} packages ready")
+        return _result("Python Packages", "warn", "⚠ Incomplete", f"Missing: {', '.join(missing)}")
+    
+    return [
+        ("adb", adb),
+        ("Emulator", emulators),
+        ("mitmproxy", mitmproxy),
+        (f"mitmproxy (port {proxy_port})", proxy_listener),
+        (f"mitmweb UI (port {web_port})", web_ui),
+        ("Python Packages", packages)
+    ]
+
+
+def device_checks(serial, proxy_port=8080):
+    """Checks that run once per attached device, as (name, callable) pairs."""
+    def target_app():
+        if check_target_app_installed(serial):
+            return _result("Target App", "pass", "✓ Installed", "com.target.ui found", serial)
+        return _result("Target App", "fail", "✗ Not Installed", "Install Target APK on emulator", serial)
+    
+    def proxy():
+        proxy_status = check_emulator_proxy(serial, proxy_port)
+        if proxy_status is True:
+            return _result("Emulator Proxy", "pass", "✓ Configured", f"Proxy: {get_emulator_proxy(serial)}", serial)
+        if proxy_status is False:
+            return _result("Emulator Proxy", "fail", "✗ Not Set", f"Set proxy to 10.0.2.2:{proxy_port}", serial)
+        return _result("Emulator Proxy", "unknown", "? Unknown", "Verify manually in emulator WiFi settings", serial)
+    
+    return [("Target App", target_app), ("Emulator Proxy", proxy)]
+
+
+def run_checks(checks, timeout=CHECK_TIMEOUT, workers=16):
+    """
+    Run (name, callable) checks concurrently.
+    
+    A check still running after `timeout` seconds is reported as timed out
+    instead of holding up the whole report.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [(name, executor.submit(check)) for name, check in checks]
+    wait([future for _, future in futures], timeout=timeout)
+    executor.shutdown(wait=False, cancel_futures=True)
+    
+    results = []
+    for name, future in futures:
+        if not future.done():
+            results.append(_result(name, "timeout", "⏱ Timed Out", f"No result after {timeout}s"))
+        elif future.exception() is not None:
+            results.append(_result(name, "fail", "✗ Error", str(future.exception())))
+        else:
+            results.append(future.result())
+    return results
+
+
+def verify(devices=None, proxy_port=8080, web_port=8081, timeout=CHECK_TIMEOUT):
+    """
+    Verify the host and every device in one concurrent pass.
+    
+    Args:
+        devices: Device serials to check; defaults to every attached device.
+    
+    Returns a machine-readable report dict.
+    """
+    clear_command_cache(timeout)
+    if devices is None:
+        devices = list_devices()
+    
+    # With no device attached, still report the device checks (as failures)
+    checks = host_checks(proxy_port, web_port)
+    for serial in devices or [None]:
+        checks += device_checks(serial, proxy_port)
+    results = run_checks(checks, timeout=timeout)
+    
+    passed = sum(1 for result in results if result["status"] == "pass")
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "devices": devices,
+        "passed": passed,
+        "total": len(results),
+        "ok": passed == len(results),
+        "checks": results
+    }
+
+
 def main():
     """Run all verification checks."""
+    parser = argparse.ArgumentParser(description="Verify emulator and proxy setup")
+    parser.add_argument("--devices", help="Comma-separated device serials (default: all attached)")
+    parser.add_argument("--proxy-port", type=int, default=8080, help="mitmproxy listen port")
+    parser.add_argument("--web-port", type=int, default=8081, help="mitmweb UI port")
+    parser.add_argument("--timeout", type=float, default=CHECK_TIMEOUT, help="Per-check timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report instead of a table")
+    
+    args = parser.parse_args()
+    devices = args.devices.split(",") if args.devices else None
+    report = verify(devices, args.proxy_port, args.web_port, args.timeout)
+    
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0 if report["ok"] else 1
+    
     console.print("\n[bold cyan]Target Store Maps Scraper - Setup Verification[/bold cyan]\n")
     
     # Create results table
@@ -134,81 +316,19 @@ def main():
     table.add_column("Status", style="magenta")
     table.add_column("Details", style="white")
     
-    checks_passed = 0
-    total_checks = 0
-    
-    # Check 1: adb
-    total_checks += 1
-    if check_command_exists("adb"):
-        table.add_row("adb", "✓ Installed", "Android Debug Bridge ready")
-        checks_passed += 1
-    else:
-        table.add_row("adb", "✗ Not Found", "Install Android SDK platform-tools")
-    
-    # Check 2: Emulator running
-    total_checks += 1
-    emulator_name = get_emulator_name()
-    if emulator_name:
-        table.add_row("Emulator", "✓ Running", f"Device: {emulator_name}")
-        checks_passed += 1
-    else:
-        table.add_row("Emulator", "✗ Not Running", "Start emulator with AVD Manager")
-    
-    # Check 3: Target app
-    total_checks += 1
-    if check_target_app_installed():
-        table.add_row("Target App", "✓ Installed", "com.target.ui found")
-        checks_passed += 1
-    else:
-        table.add_row("Target App", "✗ Not Installed", "Install Target APK on emulator")
-    
-    # Check 4: mitmproxy command
-    total_checks += 1
-    if check_command_exists("mitmproxy"):
-        table.add_row("mitmproxy", "✓ Installed", "Proxy tool ready")
-        checks_passed += 1
-    else:
-        table.add_row("mitmproxy", "✗ Not Found", "Install: brew install mitmproxy")
-    
-    # Check 5: mitmproxy running
-    total_checks += 1
-    if check_port_open("localhost", 8080):
-        table.add_row("mitmproxy (port 8080)", "✓ Running", "Proxy listener active")
-        checks_passed += 1
-    else:
-        table.add_row("mitmproxy (port 8080)", "✗ Not Running", "Start: mitmweb --listen-port 8080")
-    
-    # Check 6: mitmweb UI
-    total_checks += 1
-    if check_port_open("localhost", 8081):
-        table.add_row("mitmweb UI (port 8081)", "✓ Running", "http://localhost:8081")
-        checks_passed += 1
-    else:
-        table.add_row("mitmweb UI (port 8081)", "✗ Not Running", "Access UI after starting mitmweb")
-    
-    # Check 7: Emulator proxy
-    total_checks += 1
-    proxy_status = check_emulator_proxy()
-    if proxy_status is True:
-        table.add_row("Emulator Proxy", "✓ Configured", "Proxy settings detected")
-        checks_passed += 1
-    elif proxy_status is False:
-        table.add_row("Emulator Proxy", "✗ Not Set", "Set proxy to 10.0.2.2:8080")
-    else:
-        table.add_row("Emulator Proxy", "? Unknown", "Verify manually in emulator WiFi settings")
-    
-    # Check 8: Python packages
-    total_checks += 1
-    installed, missing = check_python_packages()
-    if not missing:
-        table.add_row("Python Packages", "✓ Installed", f"{len(installed)} packages ready")
-        checks_passed += 1
-    else:
-        table.add_row("Python Packages", "⚠ Incomplete", f"Missing: {', '.join(missing)}")
+    multiple_devices = len(report["devices"]) > 1
+    for result in report["checks"]:
+        component = result["component"]
+        if multiple_devices and result["device"]:
+            component = f"{component} ({result['device']})"
+        table.add_row(component, result["label"], result["details"])
     
     console.print(table)
     console.print()
     
+    checks_passed = report["passed"]
+    total_checks = report["total"]
+    
     # Summary
     if checks_passed == total_checks:
         console.print("[bold green]✓ All checks passed! Ready to capture API traffic.[/bold green]\n")
@@ -228,9 +348,3 @@ def main():
 
 if __name__ == "__main__":
     sys.exit(main())
-
-
-
-
-
-
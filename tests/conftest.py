@@ -0,0 +1,79 @@
+"""
+Shared pytest fixtures.
+
+The scripts in scripts/ import each other as top-level modules, so the
+directory is put on sys.path here the same way running them directly does.
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+class StubServer:
+    """
+    Local stand-in for the Target API.
+
+    `handler(method, path, headers, body)` returns (status, body, headers);
+    dict bodies are sent as JSON. Every request is recorded in `requests`.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with stub._lock:
+                    stub.requests.append({"method": self.command, "path": self.path, "headers": dict(self.headers)})
+                status, payload, extra = stub.handler(self.command, self.path, self.headers, body)
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode()
+                    extra = {"Content-Type": "application/json", **extra}
+                self.send_response(status)
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def count(self, path_prefix):
+        with self._lock:
+            return sum(1 for r in self.requests if r["path"].startswith(path_prefix))
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    """Start a StubServer; set `.handler` before sending requests."""
+    server = StubServer(lambda method, path, headers, body: (404, b"", {}))
+    yield server
+    server.close()
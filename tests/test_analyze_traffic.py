@@ -0,0 +1,71 @@
+import json
+
+from analyze_traffic import TrafficAnalyzer, template_key
+from conftest import FIXTURES
+
+
+def analyze_fixture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analyzer = TrafficAnalyzer(FIXTURES / "store_mode_session.har")
+    assert analyzer.load_capture()
+    analyzer.analyze()
+    return analyzer
+
+
+def test_extracts_replayable_headers_and_token(tmp_path, monkeypatch):
+    analyzer = analyze_fixture(tmp_path, monkeypatch)
+
+    captured = analyzer.endpoint_headers[template_key("GET", "api.target.com", "/stores/1234/map/layout")]
+    # Pseudo-headers and per-request headers are not replayed
+    assert captured["headers"] == {
+        "Authorization": "Bearer opaque-token-1",
+        "X-Api-Version": "3",
+        "User-Agent": "Target/2025.1 Android"
+    }
+    assert captured["auth"] == {
+        "header": "Authorization",
+        "scheme": "Bearer",
+        "token": "opaque-token-1",
+        "expires_at": None
+    }
+
+
+def test_records_auth_endpoint(tmp_path, monkeypatch):
+    analyzer = analyze_fixture(tmp_path, monkeypatch)
+
+    auth = analyzer.auth_endpoint
+    assert auth["method"] == "POST"
+    assert auth["url"] == "https://gsp.target.com/gsp/oauth_tokens/v2/client_tokens"
+    assert auth["body"] == '{"grant_type":"client_credentials"}'
+    assert auth["token"] == "opaque-token-1"
+    assert auth["expires_in"] == 3600
+    assert auth["issued_at"] == 1735732800.0
+    assert "Content-Length" not in auth["headers"]
+
+
+def test_findings_file_carries_headers(tmp_path, monkeypatch):
+    analyzer = analyze_fixture(tmp_path, monkeypatch)
+
+    with open(analyzer.output_file) as f:
+        findings = json.load(f)
+    assert findings["auth_endpoint"]["token"] == "opaque-token-1"
+    assert template_key("GET", "api.target.com", "/stores/1234/map/layout") in findings["endpoint_headers"]
+
+
+def test_empty_run_keeps_previous_analysis(tmp_path, monkeypatch):
+    analyzer = analyze_fixture(tmp_path, monkeypatch)
+    previous = analyzer.output_file.read_text()
+
+    # Same capture name, but nothing map-related in it this time
+    har = tmp_path / "store_mode_session.har"
+    har.write_text(json.dumps({"log": {"entries": [{
+        "request": {"method": "GET", "url": "https://api.target.com/guest/profile", "headers": []},
+        "response": {"status": 200, "content": {}}
+    }]}}))
+    rerun = TrafficAnalyzer(har)
+    rerun.load_capture()
+    rerun.analyze()
+
+    assert rerun.output_file == analyzer.output_file
+    assert analyzer.output_file.read_text() == previous
+    assert list(analyzer.output_file.parent.glob("*.partial")) == []
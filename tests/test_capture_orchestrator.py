@@ -0,0 +1,161 @@
+import json
+import socket
+import stat
+import sys
+import textwrap
+
+import pytest
+
+from capture_orchestrator import CaptureOrchestrator, CaptureWorker, shard
+
+STUB_ADB = """
+import json, os, sys
+with open(os.environ["STUB_LOG"], "a") as f:
+    f.write(json.dumps(["adb"] + sys.argv[1:]) + "\\n")
+"""
+
+# Listens like mitmdump and writes its HAR only when stopped with SIGINT
+STUB_MITMDUMP = """
+import json, os, signal, socket, sys
+args = sys.argv[1:]
+port = int(args[args.index("--listen-port") + 1])
+har = args[args.index("--set") + 1].split("=", 1)[1]
+sock = socket.socket()
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+sock.bind(("127.0.0.1", port))
+sock.listen()
+print("stub mitmdump listening on", port, flush=True)
+
+def stop(signum, frame):
+    if os.environ.get("STUB_WRITE_HAR", "1") == "1":
+        with open(har, "w") as f:
+            json.dump({"log": {"entries": []}}, f)
+    with open(os.environ["STUB_LOG"], "a") as f:
+        f.write(json.dumps(["mitmdump", port, signal.Signals(signum).name]) + "\\n")
+    sys.exit(0)
+
+signal.signal(signal.SIGINT, stop)
+while True:
+    conn, _ = sock.accept()
+    conn.close()
+"""
+
+STORES = [
+    {"id": "T-1", "coordinates": {"latitude": 44.97, "longitude": -93.26}},
+    {"id": "T-2", "coordinates": {"latitude": 40.71, "longitude": -74.00}},
+    {"id": "T-3", "coordinates": {"latitude": 34.05, "longitude": -118.24}},
+]
+
+
+def write_stub(path, source):
+    path.write_text(f"#!{sys.executable}\n" + textwrap.dedent(source))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def free_port_pair():
+    """A port whose successor is also free, for base_port + i."""
+    for _ in range(50):
+        with socket.socket() as first:
+            first.bind(("127.0.0.1", 0))
+            port = first.getsockname()[1]
+            with socket.socket() as second:
+                try:
+                    second.bind(("127.0.0.1", port + 1))
+                except OSError:
+                    continue
+        return port
+    pytest.skip("no adjacent free ports")
+
+
+@pytest.fixture
+def stubs(tmp_path, monkeypatch):
+    log = tmp_path / "calls.log"
+    monkeypatch.setenv("STUB_LOG", str(log))
+    options = {
+        "adb": write_stub(tmp_path / "adb", STUB_ADB),
+        "mitmdump": write_stub(tmp_path / "mitmdump", STUB_MITMDUMP),
+        "output_dir": tmp_path / "captured",
+        "dwell": 0,
+        "startup_timeout": 10,
+    }
+
+    def calls():
+        return [json.loads(line) for line in log.read_text().splitlines()] if log.exists() else []
+
+    return options, calls
+
+
+def test_shard_round_robin():
+    assert shard([1, 2, 3, 4, 5], 2) == [[1, 3, 5], [2, 4]]
+    assert shard([1], 3) == [[1], [], []]
+
+
+def test_orchestrator_captures_every_store(stubs):
+    options, calls = stubs
+    base_port = free_port_pair()
+    orchestrator = CaptureOrchestrator(["emulator-5554", "emulator-5556"], base_port=base_port, **options)
+
+    assert [(w.serial, w.port) for w in orchestrator.workers] == [
+        ("emulator-5554", base_port), ("emulator-5556", base_port + 1)
+    ]
+
+    results = orchestrator.run(STORES)
+
+    assert {store_id: result["device"] for store_id, result in results.items()} == {
+        "T-1": "emulator-5554", "T-2": "emulator-5556", "T-3": "emulator-5554"
+    }
+    assert all(result["error"] is None for result in results.values())
+    assert all(json.load(open(result["capture_file"])) for result in results.values())
+
+    log = calls()
+    # Each device is pointed at its own proxy port
+    assert ["adb", "-s", "emulator-5556", "shell", "settings", "put", "global", "http_proxy",
+            f"10.0.2.2:{base_port + 1}"] in log
+    # geo fix takes longitude, then latitude
+    assert ["adb", "-s", "emulator-5556", "emu", "geo", "fix", "-74.0", "40.71"] in log
+    assert ["adb", "-s", "emulator-5554", "emu", "geo", "fix", "-118.24", "34.05"] in log
+    # mitmdump is stopped with SIGINT once per store so it flushes the HAR
+    stops = [entry for entry in log if entry[0] == "mitmdump"]
+    assert sorted(stops) == sorted([["mitmdump", base_port, "SIGINT"]] * 2 + [["mitmdump", base_port + 1, "SIGINT"]])
+    # The proxy setting is cleared when a worker finishes
+    assert ["adb", "-s", "emulator-5554", "shell", "settings", "put", "global", "http_proxy", ":0"] in log
+    assert (options["output_dir"] / f"mitmdump_{base_port}.log").read_text().startswith("stub mitmdump listening")
+
+
+def test_manifest_maps_stores_to_captures(stubs, tmp_path):
+    options, _ = stubs
+    base_port = free_port_pair()
+    orchestrator = CaptureOrchestrator(["emulator-5554"], base_port=base_port, **options)
+    results = orchestrator.run(STORES[:2])
+
+    manifest = json.loads(orchestrator.save_manifest(options["output_dir"]).read_text())
+
+    assert manifest["devices"] == [{"serial": "emulator-5554", "port": base_port}]
+    assert manifest["results"] == results
+    assert set(manifest["results"]) == {"T-1", "T-2"}
+
+
+def test_missing_har_is_a_failure(stubs, monkeypatch):
+    options, _ = stubs
+    monkeypatch.setenv("STUB_WRITE_HAR", "0")
+    orchestrator = CaptureOrchestrator(["emulator-5554"], base_port=free_port_pair(), **options)
+
+    results = orchestrator.run(STORES[:1])
+
+    assert "wrote no HAR" in results["T-1"]["error"]
+    assert results["T-1"]["capture_file"] is None
+
+
+def test_port_already_in_use_is_a_failure(stubs):
+    options, calls = stubs
+    with socket.socket() as other_proxy:
+        other_proxy.bind(("127.0.0.1", 0))
+        other_proxy.listen()
+        port = other_proxy.getsockname()[1]
+        worker = CaptureWorker("emulator-5554", port, **options)
+        errors = []
+        worker.run(STORES[:1], lambda store_id, serial, har, error: errors.append(error))
+
+    assert "already in use" in errors[0]
+    assert not any(entry[0] == "mitmdump" for entry in calls())
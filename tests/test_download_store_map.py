@@ -0,0 +1,75 @@
+from urllib.parse import urlparse
+
+from analyze_traffic import TrafficAnalyzer
+from conftest import FIXTURES
+from download_store_map import StoreMapDownloader, make_token_refresher
+from token_cache import TokenCache
+
+
+def api_handler(method, path, headers, body):
+    if path.startswith("/auth"):
+        return 200, {"access_token": "fresh", "expires_in": 3600}, {}
+    if headers.get("Authorization") == "Bearer fresh":
+        return 200, {"ok": True}, {}
+    return 401, {"error": "token expired"}, {}
+
+
+def test_401_invalidates_token_and_retries(stub_server):
+    stub_server.handler = api_handler
+    auth = {"method": "POST", "url": f"{stub_server.url}/auth/token", "headers": {}, "body": None}
+    downloader = StoreMapDownloader("T-1234", token_cache=TokenCache(refresher=make_token_refresher(auth)))
+    domain = urlparse(stub_server.url).netloc
+    downloader.token_cache.put(domain, "stale")
+
+    response = downloader.request("GET", f"{stub_server.url}/stores/T-1234/map")
+
+    assert response.status_code == 200
+    assert [r["headers"].get("Authorization") for r in stub_server.requests if r["path"].startswith("/stores")] == [
+        "Bearer stale", "Bearer fresh"
+    ]
+    assert downloader.token_cache.refresh_count == 1
+    assert downloader.token_cache.peek(domain)[0] == "fresh"
+
+
+def test_401_without_refresher_is_returned(stub_server):
+    stub_server.handler = api_handler
+    downloader = StoreMapDownloader("T-1234")
+    downloader.token_cache.put(urlparse(stub_server.url).netloc, "stale")
+
+    response = downloader.request("GET", f"{stub_server.url}/stores/T-1234/map")
+
+    assert response.status_code == 401
+    assert stub_server.count("/stores") == 1
+
+
+def test_opaque_token_expiry_comes_from_auth_response(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analyzer = TrafficAnalyzer(FIXTURES / "store_mode_session.har")
+    analyzer.load_capture()
+    analyzer.analyze()
+
+    downloader = StoreMapDownloader("T-1234")
+    downloader.endpoint_headers = analyzer.endpoint_headers
+    downloader.auth_endpoint = analyzer.auth_endpoint
+    downloader._seed_token_cache()
+
+    # issued 2025-01-01T12:00:00Z with expires_in 3600
+    assert downloader.token_cache.peek("api.target.com") == ("opaque-token-1", 1735736400.0)
+    assert downloader.token_cache.refresher is not None
+
+
+def test_captured_headers_are_replayed_with_cached_token(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analyzer = TrafficAnalyzer(FIXTURES / "store_mode_session.har")
+    analyzer.load_capture()
+    analyzer.analyze()
+
+    downloader = StoreMapDownloader("T-1234")
+    downloader.endpoint_headers = analyzer.endpoint_headers
+    downloader.token_cache.put("api.target.com", "newer-token")
+
+    headers, token = downloader.headers_for("GET", "https://api.target.com/stores/5678/map/layout")
+
+    assert token == "newer-token"
+    assert headers["Authorization"] == "Bearer newer-token"
+    assert headers["X-Api-Version"] == "3"
@@ -0,0 +1,109 @@
+import errno
+import json
+from pathlib import Path
+
+import fetch_planner
+from analyze_traffic import TrafficAnalyzer
+from download_store_map import StoreMapDownloader
+from fetch_planner import AssetFetcher, FetchPlanner, SharedAssetCache, url_template
+from token_cache import TokenRefreshError
+
+
+def har_entry(url):
+    return {
+        "startedDateTime": "2025-01-01T12:00:00.000Z",
+        "request": {"method": "GET", "url": url, "headers": []},
+        "response": {"status": 200, "bodySize": 2, "content": {"mimeType": "application/json", "text": "{}"}}
+    }
+
+
+def test_url_template_replaces_store_and_floor():
+    template, floor = url_template("https://api.target.com/stores/1234/floors/2/tiles?store=1234&z=3")
+
+    assert template == "https://api.target.com/stores/{store_id}/floors/{floor}/tiles?store={store_id}&z=3"
+    assert floor == "2"
+
+
+def test_analyzer_keeps_shared_assets_for_the_planner(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    har = tmp_path / "session.har"
+    har.write_text(json.dumps({"log": {"entries": [
+        har_entry("https://api.target.com/stores/1234/map/layout"),
+        har_entry("https://cdn.target.com/assets/sprites/v2/icons.png"),
+        har_entry("https://api.target.com/guest/profile"),
+    ]}}))
+    analyzer = TrafficAnalyzer(har)
+    analyzer.load_capture()
+    analyzer.analyze()
+
+    with open(analyzer.output_file) as f:
+        endpoints = json.load(f)["interesting_endpoints"]
+    planner = FetchPlanner(endpoints)
+
+    assert [e["path"] for e in endpoints] == ["/stores/1234/map/layout", "/assets/sprites/v2/icons.png"]
+    shared = [a for a in planner.asset_requests("T-1") if a.shared]
+    assert [a.url for a in shared] == ["https://cdn.target.com/assets/sprites/v2/icons.png"]
+
+
+def crawl_handler(method, path, headers, body):
+    if path.endswith("/map/layout"):
+        return 200, {"floors": [{"id": "1"}, {"id": "2"}]}, {}
+    if "/floors/2/" in path:
+        return 404, {"error": "no POIs on this floor"}, {}
+    if "/floors/1/" in path:
+        return 200, {"aisles": [{"id": "a1"}]}, {}
+    return 200, b"sprite", {"Content-Type": "image/png"}
+
+
+def test_shared_assets_are_fetched_once_and_failed_assets_recorded(stub_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stub_server.handler = crawl_handler
+    downloader = StoreMapDownloader(asset_cache=SharedAssetCache())
+    downloader.planner = FetchPlanner([
+        {"method": "GET", "url": f"{stub_server.url}/stores/1234/map/layout", "path": "/stores/1234/map/layout"},
+        {"method": "GET", "url": f"{stub_server.url}/stores/1234/floors/1/pois", "path": "/stores/1234/floors/1/pois"},
+        {"method": "GET", "url": f"{stub_server.url}/static/sprites/icons.png", "path": "/static/sprites/icons.png"},
+    ])
+
+    maps = [downloader.clone_for_store(store_id).download_map(show_progress=False) for store_id in ("T-1", "T-2")]
+
+    assert stub_server.count("/static/sprites") == 1
+    assert downloader.asset_cache.hits == 1
+    for map_data in maps:
+        by_url = {Path(a["url"]).parent.name + "/" + a["kind"]: a for a in map_data["map"]["assets"]}
+        assert "404" in by_url["2/pois"]["error"]
+        assert "error" not in by_url["1/pois"]
+        assert map_data["metadata"]["aisles"] == [{"id": "a1", "floor": "1"}]
+
+
+def test_token_and_disk_failures_only_cost_their_asset(stub_server, tmp_path, monkeypatch):
+    stub_server.handler = crawl_handler
+    downloader = StoreMapDownloader("T-1")
+    planner = FetchPlanner([
+        {"method": "GET", "url": f"{stub_server.url}/stores/1234/map/layout", "path": "/stores/1234/map/layout"},
+        {"method": "GET", "url": f"{stub_server.url}/stores/1234/floors/1/pois", "path": "/stores/1234/floors/1/pois"},
+        {"method": "GET", "url": f"{stub_server.url}/static/sprites/icons.png", "path": "/static/sprites/icons.png"},
+    ])
+
+    def request(method, url, **kwargs):
+        if "/floors/2/" in url:
+            raise TokenRefreshError("auth endpoint returned 500")
+        return downloader.request(method, url, **kwargs)
+
+    stream_to_file = fetch_planner.stream_to_file
+
+    def disk_full_for_images(response, directory, chunk_size):
+        if response.headers.get("Content-Type") == "image/png":
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return stream_to_file(response, directory, chunk_size)
+
+    monkeypatch.setattr(fetch_planner, "stream_to_file", disk_full_for_images)
+    fetcher = AssetFetcher(request, asset_dir=tmp_path / "assets")
+
+    map_body, metadata = fetcher.fetch_store(planner, "T-1")
+
+    errors = {Path(a["url"]).parent.name + "/" + a["kind"]: a.get("error") for a in map_body["assets"]}
+    assert "auth endpoint returned 500" in errors["2/pois"]
+    assert "No space left" in errors["sprites/shared"]
+    assert errors["1/pois"] is None
+    assert metadata["aisles"] == [{"id": "a1", "floor": "1"}]
@@ -0,0 +1,165 @@
+import copy
+import json
+
+import map_diff
+from map_diff import apply_delta, canonical_digest, diff_maps, is_empty, diff_store_history, find_snapshots, rebuild, summarize
+
+TIMESTAMPS = ["20250101_120000", "20250102_120000", "20250103_120000"]
+
+
+def store_map(store_id, version):
+    aisles = [
+        {"name": "X", "floor": "1", "version": version},
+        {"name": "X", "floor": "2"},
+        {"id": "a3", "name": "Y", "floor": "1"},
+    ]
+    return {
+        "store_id": store_id,
+        "downloaded_at": str(version),
+        "note": f"capture {version}",
+        "metadata": {"floors": [{"id": "1"}, {"id": "2"}], "sections": [], "aisles": aisles, "source": version},
+    }
+
+
+def sectioned_map():
+    return {
+        "store_id": "T-1",
+        "downloaded_at": "1",
+        "metadata": {
+            "floors": [{"id": "1"}, {"id": "2"}],
+            "sections": [
+                {"id": "grocery", "floor": "1"},
+                {"id": "dairy", "floor": "1"},
+                {"id": "toys", "floor": "2"}
+            ],
+            "aisles": [
+                {"id": "a1", "section": "grocery", "floor": "1"},
+                {"id": "a2", "section": "grocery", "floor": "1"},
+                {"id": "a3", "section": "dairy", "floor": "1"},
+                {"id": "t1", "section": "toys", "floor": "2"},
+                {"id": "t2", "section": "toys", "floor": "2"}
+            ]
+        }
+    }
+
+
+def test_moves_additions_and_removals_skip_unchanged_floors(monkeypatch):
+    old = sectioned_map()
+    new = copy.deepcopy(old)
+    aisles = new["metadata"]["aisles"]
+    aisles[0]["section"] = "dairy"        # a1 moves grocery -> dairy
+    aisles[2]["name"] = "Milk"            # a3 is edited in place
+    del aisles[1]                         # a2 is removed
+    aisles.append({"id": "a4", "section": "grocery", "floor": "1"})
+
+    visited = []
+    diff_leaves = map_diff._diff_leaves
+
+    def record(collection, keys, *args):
+        visited.extend(keys)
+        return diff_leaves(collection, keys, *args)
+
+    monkeypatch.setattr(map_diff, "_diff_leaves", record)
+    delta = diff_maps(old, new)
+    changes = delta["changes"]
+
+    assert changes["aisles"]["moved"] == [{
+        "id": "a1",
+        "from": {"floor": "1", "section": "grocery"},
+        "to": {"floor": "1", "section": "dairy"},
+        "entity": aisles[0]
+    }]
+    assert [c["id"] for c in changes["aisles"]["modified"]] == ["a3"]
+    assert changes["aisles"]["removed"] == ["a2"]
+    assert [c["id"] for c in changes["aisles"]["added"]] == ["a4"]
+    assert summarize(delta) == {
+        "aisles.added": 1, "aisles.removed": 1, "aisles.modified": 1, "aisles.moved": 1
+    }
+    # Floor 2's subtree hash is unchanged, so none of it was compared
+    assert not {"2", "toys", "t1", "t2"} & set(visited)
+    assert canonical_digest(apply_delta(old, delta)) == canonical_digest(new)
+
+
+def test_moving_an_aisle_between_floors():
+    old = sectioned_map()
+    new = copy.deepcopy(old)
+    new["metadata"]["aisles"][3].update(section="grocery", floor="1")
+
+    delta = diff_maps(old, new)
+
+    moved = delta["changes"]["aisles"]["moved"]
+    assert [(m["id"], m["from"], m["to"]) for m in moved] == [
+        ("t1", {"floor": "2", "section": "toys"}, {"floor": "1", "section": "grocery"})
+    ]
+    assert summarize(delta) == {"aisles.moved": 1}
+
+
+def test_same_named_aisles_survive_a_round_trip():
+    old, new = store_map("T-1", 1), store_map("T-1", 2)
+    new["metadata"]["aisles"][1]["width"] = 3
+
+    rebuilt = apply_delta(old, diff_maps(old, new))
+
+    assert len(rebuilt["metadata"]["aisles"]) == 3
+    assert canonical_digest(rebuilt) == canonical_digest(new)
+
+
+def test_top_level_and_extra_metadata_changes_are_carried():
+    old, new = store_map("T-1", 1), store_map("T-1", 1)
+    new["note"] = "recaptured"
+    new["metadata"]["source"] = "manual"
+
+    delta = diff_maps(old, new)
+
+    assert not is_empty(delta)
+    assert canonical_digest(apply_delta(old, delta)) == canonical_digest(new)
+
+
+def test_compaction_keeps_each_stores_chain(tmp_path):
+    # Two stores saved in the same seconds, as --all-stores does
+    for store_id in ("A", "B"):
+        for version, timestamp in enumerate(TIMESTAMPS):
+            (tmp_path / f"store_{store_id}_{timestamp}.json").write_text(json.dumps(store_map(store_id, version)))
+
+    for paths in find_snapshots(tmp_path).values():
+        assert len(diff_store_history(paths, compact=True)) == 2
+
+    for store_id in ("A", "B"):
+        assert not (tmp_path / f"store_{store_id}_{TIMESTAMPS[1]}.json").exists()
+        base = tmp_path / f"store_{store_id}_{TIMESTAMPS[0]}.json"
+        middle, timestamp = rebuild(base, until=TIMESTAMPS[1])
+        assert timestamp == TIMESTAMPS[1]
+        assert canonical_digest(middle) == canonical_digest(store_map(store_id, 1))
+        latest, timestamp = rebuild(base)
+        assert timestamp == TIMESTAMPS[2]
+        assert canonical_digest(latest) == canonical_digest(store_map(store_id, 2))
+
+
+def test_rebuild_until_returns_last_version_not_after_it(tmp_path):
+    for version, timestamp in enumerate(TIMESTAMPS):
+        (tmp_path / f"store_A_{timestamp}.json").write_text(json.dumps(store_map("A", version)))
+    diff_store_history(find_snapshots(tmp_path)["A"], compact=True)
+    base = tmp_path / f"store_A_{TIMESTAMPS[0]}.json"
+
+    for until, version in [("20250102_000000", 0), ("20250102_235959", 1), ("20250201_000000", 2)]:
+        rebuilt, timestamp = rebuild(base, until=until)
+        assert timestamp == TIMESTAMPS[version]
+        assert canonical_digest(rebuilt) == canonical_digest(store_map("A", version))
+
+
+def test_compaction_refuses_when_deltas_do_not_reproduce(tmp_path):
+    for version, timestamp in enumerate(TIMESTAMPS):
+        (tmp_path / f"store_A_{timestamp}.json").write_text(json.dumps(store_map("A", version)))
+    paths = find_snapshots(tmp_path)["A"]
+    delta_file, _ = diff_store_history(paths)[-1]
+
+    # A delta that no longer rebuilds its snapshot exactly
+    with open(delta_file) as f:
+        delta = json.load(f)
+    delta["downloaded_at"] = "tampered"
+    with open(delta_file, "w") as f:
+        json.dump(delta, f)
+
+    diff_store_history(paths, compact=True)
+
+    assert all(path.exists() for path in paths)
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from map_geometry import GeometryBuffer, affine_from_control_points, local_to_latlng_matrix
+
+
+def square(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size]]
+
+
+def store_geometry():
+    # Two floors sharing local coordinates; floor 1 has a section with a
+    # hole and two aisles inside it, one given clockwise as {"x", "y"} dicts
+    return GeometryBuffer.from_map_data({"metadata": {
+        "floors": [
+            {"id": "1", "polygon": square(0, 0, 100)},
+            {"id": "2", "polygon": square(0, 0, 100)}
+        ],
+        "sections": [
+            {"id": "grocery", "floor": "1", "geometry": {
+                "type": "Polygon", "coordinates": [square(0, 0, 40), square(10, 10, 10)]
+            }},
+            {"id": "toys", "floor": "2", "outline": square(0, 0, 40)}
+        ],
+        "aisles": [
+            {"id": "a1", "floor": "1", "polygon": square(25, 0, 10)},
+            {"id": "a2", "floor": "1", "points": [{"x": x, "y": y} for x, y in reversed(square(0, 25, 10))]},
+            {"id": "a9", "floor": "2", "polygon": square(25, 0, 10)}
+        ]
+    }})
+
+
+def test_areas_subtract_holes_whatever_the_winding():
+    geometry = store_geometry()
+
+    areas = dict(zip(geometry.feature_ids, geometry.areas()))
+    assert areas == {"1": 10000, "2": 10000, "grocery": 1500, "toys": 1600, "a1": 100, "a2": 100, "a9": 100}
+
+
+def test_multipolygon_areas_add_up():
+    geometry = GeometryBuffer.from_map_data({"sections": [
+        {"id": "split", "geometry": {"type": "MultiPolygon", "coordinates": [[square(0, 0, 2)], [square(5, 5, 3)]]}}
+    ]})
+
+    assert geometry.areas().tolist() == [13.0]
+    assert geometry.bounds().tolist() == [[0, 0, 8, 8]]
+
+
+def test_centroids_account_for_holes():
+    geometry = GeometryBuffer.from_map_data({"sections": [
+        {"id": "plain", "polygon": square(0, 0, 4)},
+        {"id": "holed", "polygon": [square(0, 0, 4), square(2, 0, 2)]}
+    ]})
+
+    centroids = geometry.centroids()
+    assert centroids[0] == pytest.approx([2, 2])
+    # Removing the lower-right quarter pulls the centroid up and left
+    assert centroids[1] == pytest.approx([10 / 6, 14 / 6])
+
+
+def test_locate_prefers_smallest_overlapping_feature():
+    geometry = store_geometry()
+    ids = np.array(geometry.feature_ids + [None])
+    points = [[30, 5], [5, 30], [15, 15], [35, 35], [90, 90], [500, 500]]
+
+    # Inside an aisle, inside a clockwise aisle, in the section's hole, in
+    # the section, on the floor only, outside the store
+    assert ids[geometry.locate(points, kind=None, floor="1")].tolist() == ["a1", "a2", "1", "grocery", "1", None]
+    assert ids[geometry.locate(points, kind="aisle", floor="1")].tolist() == ["a1", "a2", None, None, None, None]
+
+
+def test_locate_only_matches_the_requested_floor():
+    geometry = store_geometry()
+    ids = np.array(geometry.feature_ids + [None])
+
+    assert ids[geometry.locate([[30, 5]], floor="1")].tolist() == ["a1"]
+    assert ids[geometry.locate([[30, 5]], floor="2")].tolist() == ["a9"]
+    assert ids[geometry.locate([[30, 5]], floor="3")].tolist() == [None]
+
+
+def test_containing_pairs_matches_across_chunks():
+    geometry = store_geometry()
+    points = np.random.default_rng(0).uniform(-10, 110, size=(500, 2))
+
+    expected = geometry.contains(points)
+    point_index, feature_index = geometry.containing_pairs(points, chunk_size=7)
+    chunked = np.zeros_like(expected)
+    chunked[point_index, feature_index] = True
+
+    assert (chunked == expected).all()
+    assert expected.any()
+
+
+def test_transform_round_trips_through_control_points():
+    geometry = store_geometry()
+    matrix = local_to_latlng_matrix(44.97, -93.26, rotation_deg=30)
+
+    world = geometry.transform(matrix)
+    inverse = affine_from_control_points(world.coords, geometry.coords)
+    back = world.transform(inverse)
+
+    assert back.coords == pytest.approx(geometry.coords, abs=1e-6)
+    assert back.feature_ids == geometry.feature_ids
+    assert back.feature_floors.tolist() == geometry.feature_floors.tolist()
+    # One local unit is one meter north of the origin
+    assert world.coords[0] == pytest.approx([-93.26, 44.97])
+    north = matrix @ [0, 1, 1] - matrix[:, 2]
+    assert np.hypot(north[0] * np.cos(np.radians(44.97)), north[1]) * 111320 == pytest.approx(1.0)
+
+
+def test_empty_buffer():
+    geometry = GeometryBuffer.from_map_data({"metadata": {"aisles": []}})
+
+    assert len(geometry) == 0
+    assert geometry.areas().shape == (0,)
+    assert geometry.bounds().shape == (0, 4)
+    assert geometry.centroids().shape == (0, 2)
+    assert geometry.contains([[1, 1]]).shape == (1, 0)
+    assert geometry.locate([[1, 1], [2, 2]], floor="1").tolist() == [-1, -1]
+    assert len(geometry.transform(local_to_latlng_matrix(0, 0))) == 0
+
+
+@pytest.mark.parametrize("feature", [
+    {"coordinates": {"x": 1, "y": 2}},
+    {"points": [{"x": 1}, {"x": 2, "y": 3}, {"x": 4, "y": 5}]},
+    {"polygon": [[0, 0], [1], [2, 2]]},
+    {"polygon": [[0, 0], [1, None], [2, 2]]},
+    {"polygon": [[0, 0], [1, 1]]},
+    {"outline": "not a ring"},
+    {"geometry": {"type": "Polygon", "coordinates": None}},
+    {"geometry": {"type": "Point", "coordinates": [1, 2]}},
+])
+def test_malformed_outlines_are_skipped(feature):
+    geometry = GeometryBuffer.from_map_data({"aisles": [
+        {"id": "bad", **feature},
+        {"id": "good", "polygon": square(0, 0, 1)}
+    ]})
+
+    assert geometry.feature_ids == ["good"]
@@ -0,0 +1,49 @@
+import json
+import os
+
+from map_query import MapIndex
+
+
+def save_map(maps_dir, store_id, sections):
+    path = maps_dir / f"store_{store_id}_latest.json"
+    path.write_text(json.dumps({
+        "store_id": store_id,
+        "downloaded_at": "2025-01-01T12:00:00",
+        "metadata": {"floors": [{"id": "1", "name": "Floor 1"}], "sections": sections, "aisles": []}
+    }))
+    return path
+
+
+def test_search_filters_by_floor_and_store(tmp_path):
+    maps_dir = tmp_path / "maps"
+    maps_dir.mkdir()
+    save_map(maps_dir, "T-1", [{"id": "s1", "name": "Starbucks", "floor": "2"}])
+    save_map(maps_dir, "T-2", [{"id": "s1", "name": "Starbucks", "floor": "1"}])
+    save_map(maps_dir, "T-3", [{"id": "s1", "name": "Starbucks Cafe", "floor": "2"}])
+    index = MapIndex(tmp_path / "maps.db")
+    index.refresh(maps_dir)
+
+    assert index.stores_with("starbucks", floor="2") == ["T-1", "T-3"]
+    assert index.stores_with("starbucks", floor="2", store_ids=["T-3"]) == ["T-3"]
+    assert [m["store_id"] for m in index.search("starbucks", store_ids=["T-2"])] == ["T-2"]
+    index.close()
+
+
+def test_refresh_is_incremental(tmp_path):
+    maps_dir = tmp_path / "maps"
+    maps_dir.mkdir()
+    save_map(maps_dir, "T-1", [{"id": "s1", "name": "Pharmacy"}])
+    path = save_map(maps_dir, "T-2", [{"id": "s1", "name": "Grocery"}])
+    index = MapIndex(tmp_path / "maps.db")
+
+    assert sorted(index.refresh(maps_dir)[0]) == ["T-1", "T-2"]
+    assert index.refresh(maps_dir) == ([], [])
+
+    save_map(maps_dir, "T-2", [{"id": "s1", "name": "Pharmacy Express"}])
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 10))
+    (maps_dir / "store_T-1_latest.json").unlink()
+
+    assert index.refresh(maps_dir) == (["T-2"], ["T-1"])
+    assert index.stores_with("pharmacy") == ["T-2"]
+    assert index.stores_with("grocery") == []
+    index.close()
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+
+import pytest
+
+import product_index
+from product_index import ProductLocationIndex, extract_locations, locations_from_file
+
+PRODUCT_RESPONSE = {
+    "data": {"product": {
+        "tcin": "12345678",
+        "fulfillment": {"store_options": [
+            {"location_id": "T-1", "store_positions": [{"aisle": 5, "block": "B", "floor": "1"}]},
+            {"location_id": "T-2", "aisle_locations": {"aisle_name": "G12"}}
+        ]},
+        "children": [{"tcin": "87654321", "location": {"aisle": "A3"}}]
+    }}
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ProductLocationIndex(tmp_path / "products.db")
+    yield index
+    index.close()
+
+
+def test_store_and_tcin_carry_down_to_nested_positions():
+    locations = sorted(extract_locations(PRODUCT_RESPONSE, store_id="T-9"))
+
+    assert locations == [
+        ("T-1", "12345678", "5", "B", "1"),
+        ("T-2", "12345678", "G12", None, None),
+        # The child has its own TCIN but inherits the request's store
+        ("T-9", "87654321", "A3", None, None),
+    ]
+
+
+def test_positions_without_a_store_or_product_are_ignored():
+    assert list(extract_locations({"tcin": "1", "aisle": "A1"})) == []
+    assert list(extract_locations({"store_id": "T-1", "aisle": "A1"})) == []
+
+
+def test_newer_observation_wins_regardless_of_order(index):
+    index.upsert_many([("T-1", "1", "A1", None, None)], observed_at=200.0)
+    index.upsert_many([("T-1", "1", "OLD", None, None)], observed_at=100.0)
+    assert index.lookup("T-1", "1")["aisle"] == "A1"
+
+    index.upsert_many([("T-1", "1", "A2", None, None)], observed_at=200.0)
+    assert index.lookup("T-1", "1")["aisle"] == "A2"
+    index.upsert_many([("T-1", "1", "A3", "S", "2")], observed_at=300.0)
+    assert index.lookup("T-1", "1") == {"aisle": "A3", "section": "S", "floor": "2", "observed_at": 300.0}
+
+
+def write_analysis(path, store_id, aisle):
+    path.write_text(json.dumps({"interesting_endpoints": [{
+        "url": f"https://redsky.target.com/redsky_aggregations/v1/product_fulfillment?tcin=1&store_id={store_id}",
+        "response_content": {"text": json.dumps({"tcin": "1", "store_positions": [{"aisle": aisle}]})}
+    }]}))
+
+
+def test_ingest_skips_unchanged_files(index, tmp_path):
+    source = tmp_path / "analysis.json"
+    write_analysis(source, "T-1", "A1")
+
+    assert index.ingest_file(source) == 1
+    assert index.ingest_file(source) is None
+    assert index.ingest_file(source, force=True) == 1
+
+    # A rewrite with a later mtime is picked up and wins
+    write_analysis(source, "T-1", "A2")
+    stat = source.stat()
+    os.utime(source, (stat.st_atime, stat.st_mtime + 10))
+    assert index.ingest_file(source) == 1
+    assert index.lookup("T-1", "1")["aisle"] == "A2"
+    assert index.stats() == {"locations": 1, "stores": 1, "sources": 1}
+
+
+def test_saved_map_assets_belong_to_the_map_store(index, tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "pois.json").write_text(json.dumps({"items": [{"tcin": "7", "aisle": "C1"}]}))
+    saved = tmp_path / "store_T-5_20250101_120000.json"
+    saved.write_text(json.dumps({"store_id": "T-5", "map": {"assets": [
+        {"url": "https://api.target.com/pois", "content_type": "application/json", "body_file": "assets/pois.json"}
+    ]}}))
+
+    assert list(locations_from_file(saved)) == [("T-5", "7", "C1", None, None)]
+
+
+def test_lookup_many_spans_batches(index):
+    count = product_index.LOOKUP_BATCH * 2 + 5
+    index.upsert_many((("T-1", str(i), f"A{i}", None, None) for i in range(count)), observed_at=1.0)
+    index.upsert_many([("T-2", "0", "other store", None, None)], observed_at=1.0)
+
+    found = index.lookup_many("T-1", list(range(count)) + ["missing"])
+
+    assert len(found) == count
+    assert found["0"]["aisle"] == "A0"
+    assert found[str(count - 1)]["aisle"] == f"A{count - 1}"
+    assert set(index.stores_for("0")) == {"T-1", "T-2"}
+
+
+def test_build_reports_bad_files_and_continues(tmp_path, monkeypatch, capsys):
+    truncated = tmp_path / "truncated.har"
+    truncated.write_text('{"log": {"entries": [')
+    good = tmp_path / "analysis.json"
+    write_analysis(good, "T-1", "A1")
+    db = tmp_path / "products.db"
+
+    monkeypatch.setattr(sys, "argv", [
+        "product_index.py", "--db", str(db), "build", str(truncated), str(tmp_path / "missing.json"), str(good)
+    ])
+    assert product_index.main() == 1
+
+    output = " ".join(capsys.readouterr().out.split())  # rich wraps long paths
+    assert "truncated.har: invalid JSON" in output
+    assert "missing.json" in output
+    index = ProductLocationIndex(db)
+    assert index.lookup("T-1", "1")["aisle"] == "A1"
+    index.close()
@@ -0,0 +1,164 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from download_store_map import StoreMapDownloader, download_stores
+from fetch_planner import FetchPlanner
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from replay_server import ReplayServer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def complete(limiter, status=200, latency=0.1, retry_after=None):
+    limiter.acquire()
+    limiter.release(status, latency, retry_after)
+
+
+def test_limit_grows_by_about_one_per_round():
+    limiter = AdaptiveRateLimiter(initial_limit=4, clock=FakeClock())
+
+    for _ in range(4):
+        complete(limiter)
+
+    assert limiter.limit == pytest.approx(4.9, abs=0.05)
+
+
+def test_limit_is_capped_at_max():
+    limiter = AdaptiveRateLimiter(initial_limit=4, max_limit=5, clock=FakeClock())
+
+    for _ in range(50):
+        complete(limiter)
+
+    assert limiter.limit == 5
+
+
+def test_throttle_halves_limit_once_per_round_trip():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(initial_limit=16, clock=clock)
+    complete(limiter, latency=0.5)
+    start = limiter.limit
+
+    clock.now = 10.0
+    complete(limiter, status=429, latency=0.5)
+    assert limiter.limit == pytest.approx(start / 2)
+
+    # Responses already in flight report the same congestion
+    complete(limiter, status=503, latency=0.5)
+    assert limiter.limit == pytest.approx(start / 2)
+
+    clock.now = 11.0
+    complete(limiter, status=None, latency=0.5)
+    assert limiter.limit == pytest.approx(start / 4)
+    assert limiter.throttled == 3
+
+
+def test_limit_never_drops_below_min():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(initial_limit=2, min_limit=1, clock=clock)
+
+    for step in range(10):
+        clock.now = step * 10.0
+        complete(limiter, status=429)
+
+    assert limiter.limit == 1
+
+
+def test_latency_spike_backs_off():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(initial_limit=8, latency_tolerance=2.0, clock=clock)
+    for _ in range(5):
+        complete(limiter, latency=0.1)
+    before = limiter.limit
+
+    clock.now = 10.0
+    for _ in range(5):
+        complete(limiter, latency=2.0)
+
+    assert limiter.limit < before / 2 + 1
+    assert limiter.throttled == 0
+
+
+def test_retry_after_pauses_workers():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(clock=clock)
+
+    complete(limiter, status=429, retry_after="3")
+
+    assert limiter.snapshot()["paused_for"] == 3.0
+    clock.now = 3.0
+    assert limiter.snapshot()["paused_for"] == 0.0
+
+
+def test_current_rate_uses_window():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rate_window=10.0, clock=clock)
+    for _ in range(20):
+        complete(limiter)
+
+    assert limiter.current_rate == 2.0
+    clock.now = 11.0
+    assert limiter.current_rate == 0.0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0),
+    (" 5 ", 5.0),
+    (7, 7.0),
+    ("Wed, 21 Oct 2015 07:28:30 GMT", 30.0),
+    ("Wed, 21 Oct 2015 07:27:00 GMT", 0.0),  # already passed
+    ("soon", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_retry_after(value, expected):
+    now = datetime(2015, 10, 21, 7, 28, 0, tzinfo=timezone.utc)
+    assert parse_retry_after(value, now=now) == expected
+
+
+def replay_analysis():
+    layout = '{"floors": [{"id": "1"}, {"id": "2"}], "sections": [{"id": "s1", "name": "Starbucks", "floor": "1"}]}'
+    return {"interesting_endpoints": [
+        {
+            "domain": "api.target.com", "method": "GET", "status": 200,
+            "url": "https://api.target.com/stores/1234/map/layout",
+            "path": "/stores/1234/map/layout",
+            "response_content": {"mimeType": "application/json", "text": layout}
+        },
+        {
+            "domain": "api.target.com", "method": "GET", "status": 200,
+            "url": "https://api.target.com/stores/1234/floors/1/pois",
+            "path": "/stores/1234/floors/1/pois",
+            "response_content": {"mimeType": "application/json", "text": '{"aisles": [{"id": "a1"}]}'}
+        }
+    ]}
+
+
+def test_crawl_converges_under_server_rate_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analysis = replay_analysis()
+    server = ReplayServer(analysis, rate_limit=100, burst=10, seed=1)
+    base_url = server.start_in_thread()
+    try:
+        downloader = StoreMapDownloader()
+        downloader.planner = FetchPlanner(analysis["interesting_endpoints"])
+        downloader.base_url = base_url
+        downloader.rate_limiter = AdaptiveRateLimiter(initial_limit=16, max_limit=32)
+
+        store_ids = [f"T-{1000 + i}" for i in range(20)]
+        results = download_stores(downloader, store_ids, workers=8)
+    finally:
+        server.stop()
+
+    # Every store completed: no request ran out of throttle retries
+    assert all(results[store_id] is not None for store_id in store_ids)
+    assert server.stats[200] == len(store_ids) * 3  # layout + POIs for two floors
+    # The server pushed back and the limiter adapted instead of failing
+    assert server.stats[429] > 0
+    assert downloader.rate_limiter.limit < 16
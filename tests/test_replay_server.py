@@ -0,0 +1,81 @@
+import gc
+import logging
+
+import requests
+
+from download_store_map import StoreMapDownloader
+from replay_server import ReplayServer, STATS_PATH, TokenBucket
+
+
+def analysis():
+    return {
+        "interesting_endpoints": [{
+            "domain": "api.target.com", "method": "GET", "status": 200,
+            "url": "https://api.target.com/stores/1234/map/layout",
+            "path": "/stores/1234/map/layout",
+            "response_content": {"mimeType": "application/json", "text": '{"floors": []}'}
+        }],
+        "auth_endpoint": {
+            "domain": "gsp.target.com", "method": "POST",
+            "url": "https://gsp.target.com/gsp/oauth_tokens/v2/client_tokens",
+            "headers": {}, "body": "{}", "token_field": "access_token",
+            "token": "replayed-token", "expires_in": 3600, "issued_at": 1735732800.0
+        }
+    }
+
+
+def test_serves_any_store_by_template():
+    server = ReplayServer(analysis())
+    base_url = server.start_in_thread()
+    try:
+        response = requests.get(f"{base_url}/stores/9999/map/layout", timeout=5)
+        stats = requests.get(f"{base_url}{STATS_PATH}", timeout=5).json()
+    finally:
+        server.stop()
+
+    assert response.status_code == 200
+    assert response.json() == {"floors": []}
+    assert stats["by_status"] == {"200": 1}
+
+
+def test_token_refresh_is_routed_to_replay_server():
+    server = ReplayServer(analysis())
+    base_url = server.start_in_thread()
+    try:
+        downloader = StoreMapDownloader("T-1234")
+        downloader.base_url = base_url
+        downloader.auth_endpoint = analysis()["auth_endpoint"]
+        downloader._seed_token_cache()
+
+        token = downloader.token_cache.get("api.target.com")
+    finally:
+        server.stop()
+
+    assert token == "replayed-token"
+    assert server.stats[200] == 1
+
+
+def test_stop_closes_keep_alive_connections(caplog):
+    server = ReplayServer(analysis())
+    base_url = server.start_in_thread()
+    session = requests.Session()
+    assert session.get(f"{base_url}/stores/1/map/layout", timeout=5).status_code == 200
+
+    with caplog.at_level(logging.ERROR, logger="asyncio"):
+        server.stop()
+        gc.collect()
+
+    session.close()
+    assert not server._connections
+    assert not [record for record in caplog.records if "pending" in record.getMessage()]
+
+
+def test_token_bucket_refills_over_time():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == 0.5
+    now[0] = 0.5
+    assert bucket.take() == 0
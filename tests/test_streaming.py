@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import download_store_map
+import fetch_planner
+from download_store_map import StoreMapDownloader
+from fetch_planner import AssetFetcher, FetchPlanner, extract_metadata, extract_metadata_from_file
+from rate_limiter import AdaptiveRateLimiter
+
+LAYOUT = {
+    "store": {
+        "floors": [{"id": "1"}, {"id": "2"}],
+        "geometry": [{"polygon": [[i, i + 1]] * 10} for i in range(2000)],
+        "nested": {"zones": {"sections": [{"id": "s1", "name": "Starbucks"}]}}
+    }
+}
+
+
+def gzip_handler(method, path, headers, body):
+    if "layout" in path:
+        return 200, gzip.compress(json.dumps(LAYOUT).encode()), {
+            "Content-Type": "application/json", "Content-Encoding": "gzip"
+        }
+    return 200, {"aisles": [{"id": "a1"}]}, {}
+
+
+def planner_for(stub_server):
+    return FetchPlanner([
+        {"method": "GET", "url": f"{stub_server.url}/stores/1234/map/layout", "path": "/stores/1234/map/layout"},
+        {"method": "GET", "url": f"{stub_server.url}/stores/1234/floors/1/pois", "path": "/stores/1234/floors/1/pois"},
+    ])
+
+
+def test_streamed_response_holds_limiter_slot_until_closed(stub_server):
+    stub_server.handler = gzip_handler
+    downloader = StoreMapDownloader("T-1234", rate_limiter=AdaptiveRateLimiter(initial_limit=1))
+
+    response = downloader.request("GET", f"{stub_server.url}/stores/1234/map/layout", stream=True)
+    assert downloader.rate_limiter.in_flight == 1
+
+    response.close()
+    response.close()
+    assert downloader.rate_limiter.in_flight == 0
+
+    downloader.request("GET", f"{stub_server.url}/stores/1234/floors/1/pois")
+    assert downloader.rate_limiter.in_flight == 0
+
+
+def test_mixed_body_sizes_do_not_shrink_limit(stub_server, monkeypatch):
+    # One clock for the downloader and limiter: every response takes 20 ms
+    # to its headers, and a third of the bodies take another 180 ms to read
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(download_store_map, "time", SimpleNamespace(
+        monotonic=lambda: clock.now, sleep=time.sleep, time=time.time
+    ))
+
+    def handler(method, path, headers, body):
+        clock.now += 0.02
+        return 200, b"x" * (65536 if "tiles" in path else 16), {}
+
+    stub_server.handler = handler
+    limiter = AdaptiveRateLimiter(initial_limit=16, max_limit=16, clock=lambda: clock.now)
+    downloader = StoreMapDownloader("T-1234", rate_limiter=limiter)
+
+    for i in range(60):
+        path = "/tiles/1" if i % 3 == 2 else "/icons/1"
+        response = downloader.request("GET", f"{stub_server.url}{path}", stream=True)
+        for _ in response.iter_content(4096):
+            pass
+        if "tiles" in path:
+            clock.now += 0.18
+        response.close()
+
+    assert limiter.limit == 16
+    assert limiter.in_flight == 0
+
+
+def test_assets_are_streamed_to_content_addressed_files(stub_server, tmp_path):
+    stub_server.handler = gzip_handler
+    downloader = StoreMapDownloader("T-5678", rate_limiter=AdaptiveRateLimiter())
+    fetcher = AssetFetcher(downloader.request, asset_dir=tmp_path / "assets", chunk_size=4096)
+
+    map_body, metadata = fetcher.fetch_store(planner_for(stub_server), "T-5678")
+
+    layout = map_body["layout"][0]
+    raw = (tmp_path / layout["body_file"]).read_bytes()
+    # Stored decompressed, named by the hash of its content
+    assert json.loads(raw) == LAYOUT
+    assert layout["sha256"] == hashlib.sha256(raw).hexdigest()
+    assert layout["size"] == len(raw)
+    assert "data" not in layout
+    assert metadata["floors"] == LAYOUT["store"]["floors"]
+    assert metadata["sections"] == [{"id": "s1", "name": "Starbucks"}]
+    assert sorted(a["floor"] for a in metadata["aisles"]) == ["1", "2"]
+    assert not list((tmp_path / "assets").glob(".partial-*"))
+    assert downloader.rate_limiter.in_flight == 0
+
+
+@pytest.mark.parametrize("document", [
+    LAYOUT,
+    {"floors": [], "a": {"floors": [{"id": "2"}]}},
+    [{"x": {"sections": [1, 2]}}, {"sections": [3]}],
+    {"a": {"b": {"c": {"d": {"e": {"aisles": [1]}}}}}},  # deeper than extract_metadata looks
+    {"aisles": {"not": "a list"}, "b": {"aisles": [{"id": "a"}]}},
+])
+def test_incremental_metadata_matches_full_parse(tmp_path, document):
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps(document))
+
+    assert extract_metadata_from_file(path) == extract_metadata(document)
+
+
+def test_fallback_without_ijson_warns(tmp_path, monkeypatch):
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps(LAYOUT))
+    monkeypatch.setattr(fetch_planner, "ijson", None)
+
+    with pytest.warns(RuntimeWarning, match="ijson"):
+        assert extract_metadata_from_file(path) == extract_metadata(LAYOUT)
@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from download_store_map import make_token_refresher
+from token_cache import TokenCache, TokenRefreshError
+
+
+def auth_endpoint(stub_server):
+    return {"method": "POST", "url": f"{stub_server.url}/auth/token", "headers": {}, "body": None}
+
+
+def test_expired_token_is_refreshed_once_for_all_threads(stub_server):
+    def handler(method, path, headers, body):
+        time.sleep(0.1)  # keep the refresh in flight while the others arrive
+        return 200, {"access_token": "fresh", "expires_in": 3600}, {}
+    stub_server.handler = handler
+
+    cache = TokenCache(refresher=make_token_refresher(auth_endpoint(stub_server)))
+    cache.put("api.target.com", "stale", expires_at=time.time() - 60)
+
+    threads = 20
+    barrier = threading.Barrier(threads)
+
+    def get_token(_):
+        barrier.wait()
+        return cache.get("api.target.com")
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        tokens = list(executor.map(get_token, range(threads)))
+
+    assert tokens == ["fresh"] * threads
+    assert stub_server.count("/auth") == 1
+    assert cache.refresh_count == 1
+    assert cache.peek("api.target.com")[1] == pytest.approx(time.time() + 3600, abs=5)
+
+
+def test_fresh_token_skips_refresh():
+    calls = []
+    cache = TokenCache(refresher=lambda scope: calls.append(scope) or ("new", None), clock=lambda: 1000)
+    cache.put("api.target.com", "cached", expires_at=2000)
+
+    assert cache.get("api.target.com") == "cached"
+    assert calls == []
+
+
+def test_token_within_skew_is_refreshed():
+    cache = TokenCache(refresher=lambda scope: ("new", 5000), expiry_skew=30, clock=lambda: 1000)
+    cache.put("api.target.com", "cached", expires_at=1020)
+
+    assert cache.get("api.target.com") == "new"
+
+
+def test_invalidate_keeps_a_newer_token():
+    cache = TokenCache()
+    cache.put("api.target.com", "newer", expires_at=None)
+
+    cache.invalidate("api.target.com", "older")
+
+    assert cache.get("api.target.com") == "newer"
+
+
+def test_expired_token_without_refresher_raises():
+    cache = TokenCache(clock=lambda: 1000)
+    cache.put("api.target.com", "stale", expires_at=10)
+
+    with pytest.raises(TokenRefreshError):
+        cache.get("api.target.com")
+
+
+def test_failed_refresh_raises_token_refresh_error(stub_server):
+    stub_server.handler = lambda method, path, headers, body: (500, b"", {})
+    cache = TokenCache(refresher=make_token_refresher(auth_endpoint(stub_server)))
+
+    with pytest.raises(TokenRefreshError):
+        cache.get("api.target.com")
@@ -0,0 +1,59 @@
+import stat
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+import verify_setup
+
+# adb stub: hangs on `adb devices`, reports a proxy on 8888 otherwise
+STUB_ADB = """
+import sys, time
+args = sys.argv[1:]
+if args == ["devices"] and "{hang}" == "1":
+    time.sleep(30)
+elif args == ["devices"]:
+    print("List of devices attached\\nemulator-5554\\tdevice\\n")
+elif args[-2:] == ["global", "http_proxy"]:
+    print("10.0.2.2:8888")
+"""
+
+
+@pytest.fixture
+def stub_adb(tmp_path, monkeypatch):
+    def install(hang=False):
+        adb = tmp_path / "adb"
+        adb.write_text(f"#!{sys.executable}\n" + textwrap.dedent(STUB_ADB).replace("{hang}", "1" if hang else "0"))
+        adb.chmod(adb.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{tmp_path}:/usr/bin:/bin")
+    yield install
+    verify_setup.clear_command_cache()
+
+
+def test_proxy_check_uses_configured_port(stub_adb):
+    stub_adb()
+    verify_setup.clear_command_cache()
+
+    assert verify_setup.check_emulator_proxy("emulator-5554", proxy_port=8888) is True
+    assert verify_setup.check_emulator_proxy("emulator-5554", proxy_port=8080) is False
+
+
+def test_timeout_applies_to_hung_commands(stub_adb):
+    stub_adb(hang=True)
+    baseline = threading.active_count()
+
+    start = time.monotonic()
+    report = verify_setup.verify(devices=["emulator-5554"], timeout=1)
+    assert time.monotonic() - start < 3
+
+    emulator = next(check for check in report["checks"] if check["component"] == "Emulator")
+    assert emulator["status"] in ("timeout", "fail")
+
+    # The hung `adb devices` is killed at the timeout, so no worker thread
+    # is left running for the interpreter to wait on at exit
+    deadline = time.monotonic() + 3
+    while threading.active_count() > baseline and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert threading.active_count() <= baseline